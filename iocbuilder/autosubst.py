@@ -1,11 +1,13 @@
 '''AutoSubstitution for scanning template files.'''
 
+import multiprocessing
 import os
 import re
 import sys
 
-from iocbuilder import recordset
-from iocbuilder.libversion import ModuleBase, modules, PythonIdentifier
+from iocbuilder import cache, recordset
+from iocbuilder.libversion import ModuleBase, ModuleVersion, modules, \
+    PythonIdentifier
 from iocbuilder.arginfo import *
 
 __all__ = ['AutoSubstitution']
@@ -50,14 +52,22 @@ def find_macros(line):
             else:
                 i = len(line)
 
-def populate_class(cls, template_file):
-    '''Returns list of keys and dictionary of defaults.'''
+# Scans the text of template_file for the macros it uses and their
+# descriptions.  Returns a dictionary of the results, including the list of
+# warnings generated as (macro_warning, text) pairs: macro warnings are only
+# reported for classes with WarnMacros set.
+def _scan_template(template_file):
     text = open(template_file).read()
     required_names = []
     default_names = []
     default_values = []
     optional_names = []
-    Obs = {}
+    # sets of the names in the lists above, for fast membership tests
+    required_set = set()
+    default_set = set()
+    optional_set = set()
+    descriptions = {}
+    warnings = []
     doc = ''
     for line in text.splitlines():
         # find all macro names
@@ -66,22 +76,27 @@ def populate_class(cls, template_file):
                 # this a macro with a default value
                 mtext, default = mtext.split('=', 1)
                 # check it's not a required value
-                if mtext in required_names + optional_names:
-                    print('***Warning: Redefining non-default macro "%s" to have '\
-                    'default "%s" in "%s"' % (mtext, default, template_file), file=sys.stderr)
+                if mtext in required_set or mtext in optional_set:
+                    warnings.append((False, '***Warning: Redefining '
+                        'non-default macro "%s" to have default "%s" in "%s"'
+                        % (mtext, default, template_file)))
                     required_names = [x for x in required_names if x != mtext]
                     optional_names = [x for x in optional_names if x != mtext]
-                if mtext in default_names:
+                    required_set.discard(mtext)
+                    optional_set.discard(mtext)
+                if mtext in default_set:
                     # if it's a default value already, check it matches
                     old_default = default_values[default_names.index(mtext)]
                     if default != old_default:
-                        print('***Warning: Cannot set macro "%s" to "%s", already '\
-                        'defined with value "%s" in "%s"' % (mtext, default, \
-                            old_default, template_file), file=sys.stderr)
+                        warnings.append((False, '***Warning: Cannot set '
+                            'macro "%s" to "%s", already defined with value '
+                            '"%s" in "%s"' % (mtext, default, old_default,
+                                template_file)))
                 else:
                     # add it as a default value
                     default_names.append(mtext)
                     default_values.append(default)
+                    default_set.add(mtext)
             else:
                 # this is a required or optional macro
                 # strip off any msi ,undefined and ,recursive stuff
@@ -89,24 +104,27 @@ def populate_class(cls, template_file):
                     mtext = mtext.replace(',undefined', '')
                 elif mtext.endswith(',recursive'):
                     mtext = mtext.replace(',recursive', '')
-                if mtext in default_names:
-                    print('***Warning: Cannot define non-default macro "%s", already '\
-                    'defined as default macro in "%s"' % (mtext, template_file), file=sys.stderr)
+                if mtext in default_set:
+                    warnings.append((False, '***Warning: Cannot define '
+                        'non-default macro "%s", already defined as default '
+                        'macro in "%s"' % (mtext, template_file)))
                 elif line.startswith('#'):
                     # comments are optional if they are epics_parser lines
                     if epics_parser_re.match(line):
-                        if mtext not in optional_names:
+                        if mtext not in optional_set:
                             optional_names.append(mtext)
+                            optional_set.add(mtext)
                 else:
-                    if mtext not in required_names:
+                    if mtext not in required_set:
                         required_names.append(mtext)
+                        required_set.add(mtext)
 
-    # Find # % gui tags and store them in cls.guiTags.
-    cls.guiTags = gui_re.findall(text)
+    # Find # % gui tags
+    guiTags = gui_re.findall(text)
 
     # find all the descriptions for ArgInfo objects
-    def add_ob(name, ob):
-        Obs[name] = ob
+    def add_ob(name, desc):
+        descriptions[name] = desc
         for l in (required_names, default_names, optional_names):
             if name in l:
                 # shift it to the end
@@ -115,7 +133,7 @@ def populate_class(cls, template_file):
                         default_values.pop(default_names.index(name)))
                 l.append(l.pop(l.index(name)))
 
-
+    all_names = required_set | default_set | optional_set
     for name, desc in macro_desc_re.findall(text):
         desc = desc.strip() # needed in case of CRLF separators in template (e.g. windows based modules)
         search = re.search(r'\n#[ \t]*', desc)
@@ -124,26 +142,126 @@ def populate_class(cls, template_file):
         # a __doc__ macro is the docstring for the object
         if name == '__doc__':
             doc = desc
-        elif name in required_names + default_names + optional_names:
-            add_ob(name, Simple(desc))
-        elif cls.WarnMacros:
-            print('***Warning: Describing non-existent macro "%s" in "%s"' % \
-                    (name, template_file), file=sys.stderr)
+        elif name in all_names:
+            add_ob(name, desc)
+        else:
+            warnings.append((True, '***Warning: Describing non-existent '
+                'macro "%s" in "%s"' % (name, template_file)))
     for name in required_names + default_names + optional_names:
-        if name not in Obs:
-            if cls.WarnMacros:
-                print('***Warning: Undescribed macro "%s" in "%s"' % \
-                    (name, template_file), file=sys.stderr)
-            add_ob(name, Simple('Template argument'))
+        if name not in descriptions:
+            warnings.append((True, '***Warning: Undescribed macro "%s" in '
+                '"%s"' % (name, template_file)))
+            add_ob(name, 'Template argument')
     # make sure optional_names aren't also required names
-    optional_names = [x for x in optional_names if x not in required_names]
+    optional_names = [x for x in optional_names if x not in required_set]
+
+    return dict(
+        required_names = required_names,
+        default_names = default_names,
+        default_values = default_values,
+        optional_names = optional_names,
+        descriptions = descriptions,
+        doc = doc,
+        guiTags = guiTags,
+        warnings = warnings)
+
+## Returns the results of scanning template_file for macros, see
+# _scan_template().  Results are cached against the modification time of the
+# template so that it is only read when it changes.
+def scan_template(template_file):
+    key = os.path.abspath(template_file)
+    stamp = cache.FileStamp(template_file)
+    scan = _TemplateScans.Lookup(key, stamp)
+    if scan is None:
+        scan = _scan_template(template_file)
+        _TemplateScans.Store(key, stamp, scan)
+    return scan
+
+# Results of scanning templates, keyed by template path.
+_TemplateScans = cache.PersistentCache('templates')
+
+# Directories of a module scanned for templates by AutoSubstitution and Xml,
+# with the extensions of the template files.
+template_dirs = [
+    ('db', ('.template', '.db')),
+    (os.path.join('etc', 'makeIocs'), ('.xml',))]
+
+# Run in the worker processes of PrescanTemplates().  A template which can't
+# be scanned is left for the error to be reported if it is used.
+def _prescan_template(template_file):
+    try:
+        return _scan_template(template_file)
+    except Exception:
+        return None
+
+## Scans all the templates in the given module directories that are not
+# already in the scan cache, spreading the work across a pool of
+# \c processes worker processes (by default one per CPU).  Template classes
+# created afterwards are populated from the cache.  Nothing is done in a
+# daemonic process, which can't start a pool: the templates are then scanned
+# in process as they are used.
+def PrescanTemplates(module_paths, processes=None):
+    if multiprocessing.current_process().daemon:
+        return
+    templates = []
+    for module_path in module_paths:
+        for subdir, extensions in template_dirs:
+            path = os.path.join(module_path, subdir)
+            if os.path.isdir(path):
+                templates.extend(sorted(
+                    os.path.join(path, filename)
+                    for filename in os.listdir(path)
+                    if filename.endswith(extensions)))
+    # Stamp the templates before scanning them, so that any changed during
+    # the scan are scanned again when used.
+    stamps = [
+        (os.path.abspath(template), cache.FileStamp(template))
+        for template in templates]
+    missing = [
+        (template, key, stamp)
+        for template, (key, stamp) in zip(templates, stamps)
+        if _TemplateScans.Lookup(key, stamp) is None]
+    if len(missing) < _PrescanThreshold:
+        # Not worth starting any processes
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        scans = pool.map(_prescan_template,
+            [template for template, _, _ in missing], chunksize = 16)
+    finally:
+        pool.close()
+        pool.join()
+    for (template, key, stamp), scan in zip(missing, scans):
+        if scan is not None:
+            _TemplateScans.Store(key, stamp, scan)
+
+# Smallest number of templates worth scanning in parallel.
+_PrescanThreshold = 8
+
+def populate_class(cls, template_file, warn=True):
+    '''Returns list of keys and dictionary of defaults.'''
+    scan = scan_template(template_file)
+    for macro_warning, text in scan['warnings']:
+        if warn and (cls.WarnMacros or not macro_warning):
+            print(text, file=sys.stderr)
+    # Take copies, the cached scan must not be modified.
+    required_names = list(scan['required_names'])
+    default_names = list(scan['default_names'])
+    default_values = list(scan['default_values'])
+    optional_names = list(scan['optional_names'])
+    Obs = dict((name, Simple(desc))
+        for name, desc in scan['descriptions'].items())
+
+    # Store # % gui tags in cls.guiTags.
+    cls.guiTags = list(scan['guiTags'])
 
     # Create all the important attributes we need if they're not already
     # given.
 
     # store the docstring
-    if doc:
-        cls.__doc__ = doc
+    if scan['doc']:
+        cls.__doc__ = scan['doc']
     # create Arguments
     if cls.Arguments is None:
         cls.Arguments = required_names + default_names + optional_names
@@ -162,6 +280,67 @@ def populate_class(cls, template_file):
         cls.ArgInfo.optional_names = optional_names
 
 
+## Stands in for an AutoSubstitution or Xml class created automatically for
+# a template by fromModuleVersion() until the class is first used.  The
+# template is only scanned if the argument information is asked for, and the
+# class itself is only created when it is looked up in its module or the
+# placeholder is called.
+class AutoClassPlaceholder(object):
+    def __init__(self, moduleVersion, name, template_file, create):
+        self.__name__ = name
+        self.ModuleName = moduleVersion.Name()
+        self.ModuleVersion = moduleVersion
+        self.__template_file = template_file
+        self.__create = create
+        self.__scanned = None
+        moduleVersion.AddPlaceholder(name, self)
+
+    def __repr__(self):
+        return "<class placeholder '%s.%s'>" % (self.ModuleName, self.__name__)
+
+    # Returns a class populated from the template, without warnings: these
+    # are left until the real class is created.
+    def __Scanned(self):
+        if self.__scanned is None:
+            class scanned:
+                Arguments = None
+                WarnMacros = False
+                __doc__ = None
+            populate_class(scanned, self.__template_file, warn=False)
+            self.__scanned = scanned
+        return self.__scanned
+
+    def __getattr__(self, name):
+        if name in ['ArgInfo', 'Arguments', 'Defaults', 'guiTags']:
+            return getattr(self.__Scanned(), name)
+        raise AttributeError(name)
+
+    @property
+    def __doc__(self):
+        return self.__Scanned().__doc__
+
+    ## Called by the module the first time the class is looked up, creates
+    # the class and adds it to the module.
+    def Create(self):
+        # We may be called while another module is loading, as in
+        # ModuleVersion.Load(), whose loading state must be set aside.
+        LoadingModule = ModuleVersion._LoadingModule
+        AutoInstances = ModuleVersion._AutoInstances
+        ModuleVersion._LoadingModule = []
+        ModuleVersion._AutoInstances = []
+        try:
+            cls = self.__create()
+        finally:
+            ModuleVersion._LoadingModule = LoadingModule
+            ModuleVersion._AutoInstances = AutoInstances
+        setattr(self.ModuleVersion.module, self.__name__, cls)
+        return cls
+
+    def __call__(self, *args, **kargs):
+        return getattr(self.ModuleVersion.module, self.__name__)(
+            *args, **kargs)
+
+
 ## Subclass of Substitution that scans its template file to find the macros it
 # uses, and creates an ArgInfo object from them.
 class AutoSubstitution(recordset.Substitution):
@@ -187,6 +366,12 @@ class AutoSubstitution(recordset.Substitution):
     def fromModuleVersion(cls, moduleVersion):
         '''Make autosubstitution objects for all files in the db dir
         of moduleVersion object'''
+        # Custom builder objects have to be known before we can tell which
+        # templates need an autoSubstitution, so wait until they're loaded.
+        if not moduleVersion.IsLoaded():
+            moduleVersion.AddLoadHook(
+                lambda: cls.fromModuleVersion(moduleVersion))
+            return
         path = os.path.join(moduleVersion.LibPath(), 'db')
         if os.path.isdir(path):
             # for each db file
@@ -198,14 +383,17 @@ class AutoSubstitution(recordset.Substitution):
                 # for it
                 if os.path.join(path, db) in cls.TemplateFiles:
                     continue
-                # make an autoSubstitution for it
+                # make a placeholder for its autoSubstitution
                 clsname = PythonIdentifier('auto_' + db.split('.')[0])
-                class temp(AutoSubstitution):
-                    WarnMacros = False
-                    ModuleName = moduleVersion.Name()
-                    TemplateFile = db
-                    TrueName = clsname
-                setattr(moduleVersion.module, clsname, temp)
+                def create(db=db, clsname=clsname):
+                    class temp(AutoSubstitution):
+                        WarnMacros = False
+                        ModuleName = moduleVersion.Name()
+                        TemplateFile = db
+                        TrueName = clsname
+                    return temp
+                AutoClassPlaceholder(
+                    moduleVersion, clsname, os.path.join(path, db), create)
 
 # This re matches an line like #% autosave 1 or # % gda_tag, template, ...
 epics_parser_re = re.compile(r'^#[ \t]*%')
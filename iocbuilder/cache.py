@@ -0,0 +1,119 @@
+'''Persistent caches of information derived from support modules.'''
+
+import atexit
+import os
+import pickle
+import tempfile
+
+from iocbuilder import paths
+
+
+__all__ = []
+
+
+## Returns a stamp identifying the current state of the given files.  The
+# stamp changes whenever any of the files is modified, created or deleted.
+def FileStamp(*filenames):
+    stamp = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+## A dictionary of values which persists between runs of the builder.
+#
+# Each entry is stored together with a stamp, typically computed by
+# FileStamp() from the files the value was derived from, and is only
+# returned by Lookup() if the stamp still matches.  Entries are held in
+# memory and written to a file named after the cache in \c paths.cache_path
+# when Flush() is called, or at exit.
+class PersistentCache(object):
+    # Bump this if the layout of the cache files changes.
+    _Version = 1
+
+    def __init__(self, name):
+        self.name = name
+        self.__entries = None
+        self.__updated = {}
+        _Caches.append(self)
+
+    def __Filename(self):
+        if paths.cache_path:
+            return os.path.join(paths.cache_path, '%s.pickle' % self.name)
+        else:
+            return None
+
+    def __ReadFile(self, filename):
+        # Any problem reading the cache simply means we start afresh.
+        try:
+            with open(filename, 'rb') as input:
+                version, entries = pickle.load(input)
+        except Exception:
+            return {}
+        if version == self._Version:
+            return entries
+        else:
+            return {}
+
+    def __Entries(self):
+        if self.__entries is None:
+            filename = self.__Filename()
+            if filename:
+                self.__entries = self.__ReadFile(filename)
+            else:
+                self.__entries = {}
+        return self.__entries
+
+    ## Returns the value stored for key if its stamp matches, otherwise
+    # returns default.
+    def Lookup(self, key, stamp, default=None):
+        try:
+            entry_stamp, value = self.__Entries()[key]
+        except KeyError:
+            return default
+        if entry_stamp == stamp:
+            return value
+        else:
+            return default
+
+    ## Records value for key, valid for as long as stamp is unchanged.
+    def Store(self, key, stamp, value):
+        self.__Entries()[key] = (stamp, value)
+        self.__updated[key] = (stamp, value)
+
+    ## Writes any new entries out to disk.  Entries written in the meantime
+    # by other processes are merged rather than overwritten, and the file is
+    # replaced atomically so that readers never see a partial cache.
+    def Flush(self):
+        filename = self.__Filename()
+        if not self.__updated or not filename:
+            return
+        entries = self.__ReadFile(filename)
+        entries.update(self.__updated)
+        try:
+            os.makedirs(paths.cache_path, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=paths.cache_path, prefix=self.name)
+            with os.fdopen(fd, 'wb') as output:
+                pickle.dump((self._Version, entries), output,
+                    pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, filename)
+        except OSError:
+            # A cache that can't be written is no worse than no cache.
+            return
+        self.__updated = {}
+
+
+# All caches created, so that they can be flushed together.
+_Caches = []
+
+## Flushes all persistent caches to disk.
+def FlushAll():
+    for cache in _Caches:
+        cache.Flush()
+
+atexit.register(FlushAll)
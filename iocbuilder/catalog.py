@@ -0,0 +1,175 @@
+'''Persistent catalog of the classes provided by each support module, so that
+their argument information is available without loading the module.'''
+
+import copy
+import os
+import pickle
+
+from iocbuilder import cache, libversion
+from iocbuilder.libversion import ModuleBase
+from iocbuilder.autosubst import template_dirs
+
+
+__all__ = []
+
+
+## Returns the module qualified names of the class cls and its base classes,
+# most derived first.  For a TypeRef or ClassStub these are the names recorded
+# from the class it stands for, and for anything else, such as an automatic
+# class placeholder, None.
+def ClassNames(cls):
+    if isinstance(cls, (TypeRef, ClassStub)):
+        # Entries catalogued before the names were recorded have none.
+        return getattr(cls, 'ClassNames', None)
+    elif isinstance(cls, type):
+        return ['%s.%s' % (base.__module__, base.__name__)
+            for base in cls.__mro__]
+    else:
+        return None
+
+
+## Returns True if cls is a subclass of base, where either can be a class, a
+# TypeRef or a ClassStub.  Where this can't be told True is returned.
+def IsSubclass(cls, base):
+    names = ClassNames(cls)
+    base_names = ClassNames(base)
+    if names is None or base_names is None:
+        return True
+    return base_names[0] in names
+
+
+## Stands in for a class named by an Ident argument in a catalogued ArgInfo.
+class TypeRef(object):
+    def __init__(self, typ):
+        self.__name__ = typ.__name__
+        self.ModuleName = getattr(typ, 'ModuleName', typ.__module__)
+        self.ClassNames = ClassNames(typ)
+
+    def __repr__(self):
+        return "<class '%s.%s'>" % (self.ModuleName, self.__name__)
+
+
+## Catalogued description of a class provided by a support module.  This
+# carries the same ArgInfo, documentation and template information as the
+# class itself, and calling it loads the module and instantiates the real
+# class.
+class ClassStub(object):
+    # Class attributes copied unchanged into the stub if present.
+    _Attributes = ['UniqueName', 'Arguments', 'Defaults', 'guiTags']
+
+    def __init__(self, cls):
+        self.__name__ = cls.__name__
+        self.__doc__ = cls.__doc__
+        self.ModuleName = cls.ModuleName
+        self.ClassNames = ClassNames(cls)
+        self.ArgInfo = _StubArgInfo(cls.ArgInfo)
+        for attr in self._Attributes:
+            if hasattr(cls, attr):
+                setattr(self, attr, getattr(cls, attr))
+
+    def __repr__(self):
+        return "<class stub '%s.%s'>" % (self.ModuleName, self.__name__)
+
+    ## Returns the class described by this stub, loading its module first
+    # if necessary.
+    def Resolve(self):
+        libversion.LoadModule(self.ModuleName)
+        for cls in ModuleBase.ModuleBaseClasses + libversion.Placeholders():
+            if getattr(cls, 'ModuleName', None) == self.ModuleName and \
+                    cls.__name__ == self.__name__:
+                return cls
+        assert False, 'Class %s.%s no longer defined' % (
+            self.ModuleName, self.__name__)
+
+    def __call__(self, *args, **kargs):
+        return self.Resolve()(*args, **kargs)
+
+
+# Returns a copy of argInfo with identifier types replaced by references so
+# that it can be stored without referring to the classes themselves.
+def _StubArgInfo(argInfo):
+    argInfo = copy.copy(argInfo)
+    argInfo.descriptions = dict(argInfo.descriptions)
+    for name, desc in list(argInfo.descriptions.items()):
+        if getattr(desc, 'ident', False):
+            desc = copy.copy(desc)
+            desc.typ = TypeRef(desc.typ)
+            argInfo.descriptions[name] = desc
+    return argInfo
+
+
+# Returns a stamp identifying the state of everything the classes of
+# moduleVersion are derived from.  Released versions of modules never change,
+# so only modules without a version number need to be examined.
+def _ModuleStamp(moduleVersion):
+    if moduleVersion.version:
+        return ('release', moduleVersion.version)
+    filenames = moduleVersion.DefinitionFiles()
+    for subdir, extensions in template_dirs:
+        path = os.path.join(moduleVersion.LibPath(), subdir)
+        if os.path.isdir(path):
+            filenames.extend(sorted(
+                os.path.join(path, filename)
+                for filename in os.listdir(path)
+                if filename.endswith(extensions)))
+    return tuple(zip(filenames, cache.FileStamp(*filenames)))
+
+
+## Records the classes provided by moduleVersion in the catalog, once it
+# has been loaded and its automatic AutoSubstitution and Xml classes have
+# been created.  If the catalog entry is up to date nothing more is done: if
+# loading of the module has been deferred it is left unloaded and Classes()
+# will return stubs for it.  Otherwise the module is loaded if necessary and
+# its entry is rebuilt.
+def Register(moduleVersion):
+    key = moduleVersion.LibPath()
+    stamp = _ModuleStamp(moduleVersion)
+    stubs = _Catalog.Lookup(key, stamp)
+    if stubs is not None:
+        if not moduleVersion.IsLoaded():
+            _Stubs[moduleVersion.Name()] = stubs
+            libversion._ClassesChanged()
+        return
+    moduleVersion.Load()
+
+    name = moduleVersion.Name()
+    stubs = []
+    for cls in ModuleBase.ModuleBaseClasses + moduleVersion.Placeholders():
+        if getattr(cls, 'ModuleName', None) == name and \
+                hasattr(cls, 'ArgInfo') and not cls.__name__.startswith('_'):
+            stubs.append(ClassStub(cls))
+    try:
+        # Anything that can't be stored, such as a default value of an
+        # unusual type, means the module simply isn't catalogued.
+        pickle.dumps(stubs, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return
+    _Catalog.Store(key, stamp, stubs)
+
+
+## Returns True if the classes of the named module are all known from the
+# catalog without loading it.
+def IsCatalogued(name):
+    return name in _Stubs and \
+        not libversion._ModuleVersionTable[name].IsLoaded()
+
+
+## Returns stubs for the catalogued classes of every registered module
+# whose loading is still deferred.
+def Classes():
+    stubs = []
+    for name, module_stubs in list(_Stubs.items()):
+        if libversion._ModuleVersionTable[name].IsLoaded():
+            # Once loaded the real classes take over.
+            del _Stubs[name]
+        else:
+            stubs.extend(module_stubs)
+    return stubs
+
+
+# Catalog of classes for each module, keyed by module path.
+_Catalog = cache.PersistentCache('catalog')
+
+# Dictionary of catalogued classes for registered modules that have not been
+# loaded, indexed by module name.
+_Stubs = {}
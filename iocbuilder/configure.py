@@ -281,6 +281,10 @@ be run from the etc/makeIocs directory, and will create iocs/<ioc_name>''')
         help='Create an ioc with arch=SIMARCH in simulation mode')
     parser.add_option('--arch', dest='architecture', default = architecture,
         help='Specify target system architecture')
+    parser.add_option('--lazy', action='store_true', dest='lazy',
+        help='Only load module definitions when they are used')
+    parser.add_option('--prescan', action='store_true', dest='prescan',
+        help='Scan the templates of all modules in parallel before loading')
     (options, args) = parser.parse_args()
     if len(args) < 1:
         parser.error(
@@ -328,7 +332,10 @@ be run from the etc/makeIocs directory, and will create iocs/<ioc_name>''')
 # - If \c dependecy_tree then:
 #  - Do a libversion::ModuleVersion call for each module listed in the tree
 #    created from <tt>\<iocname>_RELEASE</tt> and
-#    <tt>../../configure/RELEASE</tt>
+#    <tt>../../configure/RELEASE</tt>.  If \c options.lazy is set then
+#    loading of module definitions is deferred until they are used.  If
+#    \c options.prescan is set then the templates of all these modules are
+#    first scanned in parallel.
 def ParseAndConfigure(options, dependency_tree=None):
     # import iocwriter and set default iocwriter
     if options.ioc_writer is None:
@@ -381,6 +388,7 @@ def ParseAndConfigure(options, dependency_tree=None):
     from . import libversion
     libversion.Debug = getattr(options, 'debug', True)
     libversion.ReportMissingModuleFiles = False
+    lazy = getattr(options, 'lazy', False)
 
     # do the ModuleVersion calls on a dependency tree
     vs = []
@@ -403,12 +411,15 @@ def ParseAndConfigure(options, dependency_tree=None):
                     print('Multiple epics versions detected. Have you set your EPICS_HOST_ARCH correctly?')
             else:
                 leaves.append(leaf)
+        # if we don't have a name or path, it can't be a useful module
+        leaves = [l for l in leaves if l.path and l.name is not None]
+        if getattr(options, 'prescan', False):
+            # scan the templates of all the modules in parallel up front
+            from .autosubst import PrescanTemplates
+            PrescanTemplates([os.path.abspath(l.path) for l in leaves])
         from .libversion import ModuleVersion
         for name, version, path in [
-                (l.name, l.version, l.path) for l in leaves if l.path]:
-            # if we don't have a name, it can't be a useful module
-            if name is None:
-                continue
+                (l.name, l.version, l.path) for l in leaves]:
             # for work and local modules, just tell iocbuilder the path
             if version in ['work', 'local', 'invalid']:
                 home = os.path.abspath(path)
@@ -423,6 +434,6 @@ def ParseAndConfigure(options, dependency_tree=None):
                 name = name.split('/')[-1]
             # add the ModuleVersion object to the list
             vs.append(ModuleVersion(name, version, use_name=use_name,
-                    home=home))
+                    home=home, lazy=lazy))
 
     return vs
@@ -58,6 +58,7 @@ class ValidateDbField:
         self.dbEntry = mydbstatic.dbCopyEntry(dbEntry)
         self._FieldInfo = None
         self._ValidNamesSet = None
+        self._LinkFields = None
 
     # Computes list of valid names and creates associated arginfo
     # definitions.  This is postponed quite late to try and ensure the menus
@@ -66,6 +67,7 @@ class ValidateDbField:
     def __ProcessDbd(self):
         # ordered dict of field_name -> arginfo
         self._FieldInfo = OrderedDict()
+        self._LinkFields = {}
         valid_names = []
         status = mydbstatic.dbFirstField(self.dbEntry, 0)
         while status == 0:
@@ -92,6 +94,8 @@ class ValidateDbField:
             else:
                 # No access field.
                 ArgInfo = None
+            if typ in mydbstatic.FIELD_LINK_TYPES:
+                self._LinkFields[name] = mydbstatic.FIELD_LINK_TYPES[typ]
             if name != "NAME":
                 valid_names.append(name)
                 if ArgInfo is not None:
@@ -105,6 +109,13 @@ class ValidateDbField:
             self.__ProcessDbd()
         return self._FieldInfo
 
+    # Returns a dictionary mapping each link field name to its link type,
+    # one of INLINK, OUTLINK or FWDLINK.
+    def LinkFields(self):
+        if self._LinkFields is None:
+            self.__ProcessDbd()
+        return self._LinkFields
+
     def ValidNamesSet(self):
         if self._ValidNamesSet is None:
             self.__ProcessDbd()
@@ -143,10 +154,15 @@ class ValidateDbField:
 _db = ctypes.c_void_p()
 
 
+# List of (directory, filename) of all the dbd files loaded so far, in order.
+DbdFiles = []
+
+
 def LoadDbdFile(device, dbdDir, dbdfile):
     # Read the specified dbd file into the current database.  This allows
     # us to see any new definitions.  The device used to load the record is
     # also recorded for later use.
+    DbdFiles.append((dbdDir, dbdfile))
     curdir = os.getcwd()
     os.chdir(dbdDir)
     status = mydbstatic.dbReadDatabase(
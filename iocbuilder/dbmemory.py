@@ -0,0 +1,256 @@
+'''Estimates of the memory taken by the record database of an IOC.'''
+
+import os.path
+import re
+
+from iocbuilder import configure, dbd, dbparse, paths, recordset
+
+
+__all__ = ['EstimateMemory']
+
+
+# Sizes in bytes of the fixed size field types.
+_FieldSizes = {
+    'DBF_CHAR': 1, 'DBF_UCHAR': 1,
+    'DBF_SHORT': 2, 'DBF_USHORT': 2, 'DBF_ENUM': 2,
+    'DBF_MENU': 2, 'DBF_DEVICE': 2,
+    'DBF_LONG': 4, 'DBF_ULONG': 4, 'DBF_FLOAT': 4,
+    'DBF_INT64': 8, 'DBF_UINT64': 8, 'DBF_DOUBLE': 8,
+}
+
+# Sizes of the C types commonly declared by DBF_NOACCESS fields, in bytes or,
+# for negative values, in pointers.
+_TypeSizes = {
+    'char': 1, 'epicsInt8': 1, 'epicsUInt8': 1,
+    'short': 2, 'epicsInt16': 2, 'epicsUInt16': 2, 'epicsEnum16': 2,
+    'int': 4, 'epicsInt32': 4, 'epicsUInt32': 4, 'float': 4,
+    'epicsFloat32': 4,
+    'double': 8, 'epicsFloat64': 8, 'epicsInt64': 8, 'epicsUInt64': 8,
+    'epicsTimeStamp': 8,
+    'long': -1, 'unsigned': 4,
+    'ELLNODE': -2, 'ELLLIST': -3,
+}
+
+# Sizes of the array element types named by the menuFtype menu, in the order
+# of the menu.
+_Ftypes = [
+    ('STRING', 40), ('CHAR', 1), ('UCHAR', 1), ('SHORT', 2), ('USHORT', 2),
+    ('LONG', 4), ('ULONG', 4), ('INT64', 8), ('UINT64', 8), ('FLOAT', 4),
+    ('DOUBLE', 8), ('ENUM', 2)]
+_FtypeSizes = dict(_Ftypes)
+
+# The array fields of the aSub record: input A is sized by NOA and typed by
+# FTA, output VALA by NOVA and FTVA, and so on.
+_ASubLetters = 'ABCDEFGHIJKLMNOPQRSTU'
+
+
+# Returns the size of an array element of type ftype, a menuFtype choice.
+# An unset field takes the first choice.
+def _FtypeSize(ftype):
+    ftype = str(ftype or 0)
+    if ftype.isdigit() and int(ftype) < len(_Ftypes):
+        return _Ftypes[int(ftype)][1]
+    return _FtypeSizes.get(ftype, 8)
+
+
+# Returns the number in a field value, or default if it isn't a number.
+def _Number(value, default):
+    try:
+        return int(float(str(value)))
+    except ValueError:
+        return default
+
+
+# Functions computing the array memory allocated at initialisation by each
+# record type from its field values.  Each is called with a function returning
+# the value of a field, with the dbd initial value as default.
+def _Waveform(field):
+    return _Number(field('NELM'), 1) * _FtypeSize(field('FTVL'))
+
+def _SubArray(field):
+    return _Number(field('MALM'), 1) * _FtypeSize(field('FTVL'))
+
+def _Compress(field):
+    nsam = _Number(field('NSAM'), 1)
+    size = nsam * 8
+    algorithm = str(field('ALG'))
+    if algorithm == 'Average':
+        size += nsam * 8
+    elif algorithm == 'N to 1 Average':
+        size += _Number(field('N'), 1) * 8
+    return size
+
+def _Histogram(field):
+    return _Number(field('NELM'), 1) * 4
+
+def _ACalcout(field):
+    # Arrays AA to LL, AVAL, OAV and PAVAL.
+    return _Number(field('NELM'), 1) * 8 * 15
+
+def _ASub(field):
+    size = 0
+    for letter in _ASubLetters:
+        size += _Number(field('NO' + letter), 1) * \
+            _FtypeSize(field('FT' + letter) or 'DOUBLE')
+        # Both VALx and the old value OVLx are allocated
+        size += 2 * _Number(field('NOV' + letter), 1) * \
+            _FtypeSize(field('FTV' + letter) or 'DOUBLE')
+    return size
+
+_ArraySizes = {
+    'waveform': _Waveform, 'aai': _Waveform, 'aao': _Waveform,
+    'subArray': _SubArray, 'compress': _Compress, 'histogram': _Histogram,
+    'acalcout': _ACalcout, 'aSub': _ASub,
+}
+
+
+# Returns the pointer size in bytes of the configured target architecture.
+def _PointerSize():
+    architecture = configure.Architecture()
+    target, _, cpu = architecture.partition('-')
+    if target != 'vxWorks' and '64' in cpu:
+        return 8
+    else:
+        return 4
+
+
+# Returns the size of the C declaration of a DBF_NOACCESS field.
+def _ExtraSize(extra, pointer):
+    if extra is None or '*' in extra:
+        return pointer
+    words = extra.replace('[', ' [').split()
+    size = _TypeSizes.get(words[0], -1)
+    if size < 0:
+        size = -size * pointer
+    for count in re.findall(r'\[\s*(\d+)\s*\]', extra):
+        size *= int(count)
+    return size
+
+
+# Returns the size in bytes of a record of the given dbd record type.  This is
+# the sum of the field sizes, without allowing for padding.
+def _RecordSize(fields, pointer):
+    # A link is a union of the link types with a type and flags, which comes
+    # to around eight pointers.
+    link = 8 * pointer
+    size = 0
+    for name, dbf, attributes in fields:
+        if dbf == 'DBF_STRING':
+            size += _Number(attributes.get('size'), 0)
+        elif dbf in ('DBF_INLINK', 'DBF_OUTLINK', 'DBF_FWDLINK'):
+            size += link
+        elif dbf == 'DBF_NOACCESS':
+            size += _ExtraSize(attributes.get('extra'), pointer)
+        else:
+            size += _FieldSizes.get(dbf, pointer)
+    return size
+
+
+# Record types read from dbd files, indexed by the dbd file path.
+_RecordTypeCache = {}
+
+# Returns a dictionary of all record types defined by the loaded dbd files.
+# Where a record type is defined more than once the first definition is used,
+# as for the record classes.
+def _RecordTypes():
+    record_types = {}
+    for dbdDir, dbdfile in dbd.DbdFiles:
+        filename = os.path.join(dbdDir, dbdfile)
+        if filename not in _RecordTypeCache:
+            _RecordTypeCache[filename] = dbparse.RecordTypes(
+                filename, [dbdDir, os.path.join(paths.EPICS_BASE, 'dbd')])
+        for name, fields in _RecordTypeCache[filename].items():
+            record_types.setdefault(name, fields)
+    return record_types
+
+
+## Estimated database memory of an IOC, broken down by record type.
+class MemoryEstimate:
+    def __init__(self, pointer):
+        ## Size of a pointer on the target
+        self.pointer = pointer
+        ## Dictionary of [record count, record bytes, array bytes], indexed
+        # by record type
+        self.types = {}
+        ## Sorted names of the record types not defined by any loaded dbd file
+        self.unknown = []
+
+    def _Add(self, record_type, record_bytes, array_bytes):
+        entry = self.types.setdefault(record_type, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += record_bytes
+        entry[2] += array_bytes
+
+    ## Returns the estimated total database memory in bytes.
+    def Total(self):
+        return sum(
+            record_bytes + array_bytes
+            for _, record_bytes, array_bytes in self.types.values())
+
+    ## Returns a list of lines reporting the estimate for each record type
+    # and in total, largest first.
+    def Report(self):
+        lines = ['%-16s %8s %12s %12s %12s' % (
+            'Record type', 'Count', 'Record bytes', 'Array bytes', 'Total')]
+        for record_type, (count, record_bytes, array_bytes) in sorted(
+                self.types.items(), key = lambda entry: -sum(entry[1][1:])):
+            lines.append('%-16s %8d %12d %12d %12d' % (
+                record_type, count, record_bytes, array_bytes,
+                record_bytes + array_bytes))
+        lines.append('%-16s %8d %12s %12s %12d' % (
+            'Total', sum(entry[0] for entry in self.types.values()),
+            '', '', self.Total()))
+        if self.unknown:
+            lines.append('Record types not in any dbd file: %s' %
+                ', '.join(self.unknown))
+        return lines
+
+    ## Prints the report to stdout.
+    def PrintReport(self):
+        for line in self.Report():
+            print(line)
+
+
+## Estimates the memory taken by the records of the IOC, both those
+# published directly and those expanded from substitutions.  Each record
+# takes the size of its record structure, from the field definitions in the
+# loaded dbd files, plus a record node and its name, plus any arrays it
+# allocates at initialisation.  Returns a MemoryEstimate.
+#
+# \param pointer
+#   Pointer size of the target in bytes, by default worked out from the
+#   configured architecture.
+def EstimateMemory(pointer = None):
+    if pointer is None:
+        pointer = _PointerSize()
+    record_types = _RecordTypes()
+    sizes = {}
+    estimate = MemoryEstimate(pointer)
+    unknown = set()
+
+    def add(record_type, name, fields):
+        if record_type not in record_types:
+            unknown.add(record_type)
+            return
+        if record_type not in sizes:
+            sizes[record_type] = (
+                _RecordSize(record_types[record_type], pointer),
+                dict((field, attributes.get('initial'))
+                    for field, _, attributes in record_types[record_type]))
+        size, initial = sizes[record_type]
+
+        def field(name):
+            value = fields.get(name)
+            if value is None:
+                value = initial.get(name)
+            return value
+        array_size = _ArraySizes.get(record_type, lambda field: 0)(field)
+        # The record node is a list node and two pointers
+        node_size = 4 * pointer + len(name) + 1
+        estimate._Add(record_type, size + node_size, array_size)
+
+    for record_type, name, fields in recordset.ExpandedRecords():
+        add(record_type, name, fields)
+
+    estimate.unknown = sorted(unknown)
+    return estimate
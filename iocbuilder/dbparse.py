@@ -0,0 +1,182 @@
+'''Minimal parser for the text of dbd and db files, used to read record type
+definitions and template records without the EPICS static database.'''
+
+import os.path
+import re
+
+
+__all__ = []
+
+
+# Tokens of the dbd and db file grammar.  Unquoted words can contain macro
+# references.
+_Tokens = re.compile(r'''
+    (?P<skip> \s+ | \#[^\n]* ) |
+    (?P<string> "(?:[^"\\]|\\.)*" ) |
+    (?P<punct> [(){},] ) |
+    (?P<word> (?: [^\s(){},"\#$] | \$\([^()]*\) | \$\{[^{}]*\} | \$ )+ )''',
+    re.VERBOSE)
+
+# Lines starting with % are C code passed through to generated headers.
+_CodeLine = re.compile(r'^[ \t]*%.*$', re.MULTILINE)
+
+# Matches a macro reference $(NAME), ${NAME}, $(NAME=default) or
+# ${NAME=default}.
+_Macro = re.compile(
+    r'\$(?:\(([^()=]*)(?:=([^()]*))?\)|\{([^{}=]*)(?:=([^{}]*))?\})')
+
+
+# Returns text with the given macros expanded.  References to undefined
+# macros without a default are left unchanged.
+def ExpandMacros(text, macros):
+    def expand(match):
+        name = match.group(1) or match.group(3)
+        default = match.group(2)
+        if default is None:
+            default = match.group(4)
+        if name in macros:
+            return str(macros[name])
+        elif default is not None:
+            return default
+        else:
+            return match.group(0)
+    # Macro values can themselves refer to macros, but stop if they never
+    # settle down.
+    for i in range(10):
+        expanded = _Macro.sub(expand, text)
+        if expanded == text:
+            break
+        text = expanded
+    return text
+
+
+# Splits text into a list of tokens.  Quoted strings are returned with their
+# quotes removed as (string,) tuples so that they can't be confused with
+# punctuation.
+def _Tokenise(text, filename):
+    text = _CodeLine.sub('', text)
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _Tokens.match(text, pos)
+        assert match, 'Syntax error in %s at "%s"' % (
+            filename, text[pos:pos + 20])
+        pos = match.end()
+        if match.lastgroup == 'string':
+            tokens.append((re.sub(r'\\(.)', r'\1', match.group()[1:-1]),))
+        elif match.lastgroup != 'skip':
+            tokens.append(match.group())
+    return tokens
+
+
+# Parses a sequence of definitions of the form
+#     keyword(arg, ...) { body }
+# where the body is optional, from tokens starting at pos.  Returns the list of
+# (keyword, args, body) definitions and the position of the closing brace or
+# the end of the tokens.
+def _Parse(tokens, pos, filename):
+    definitions = []
+    while pos < len(tokens) and tokens[pos] != '}':
+        keyword = tokens[pos]
+        assert isinstance(keyword, str), \
+            'Unexpected string "%s" in %s' % (keyword[0], filename)
+        pos += 1
+        args = []
+        if pos < len(tokens) and tokens[pos] == '(':
+            pos += 1
+            while tokens[pos] != ')':
+                if tokens[pos] != ',':
+                    arg = tokens[pos]
+                    args.append(arg[0] if isinstance(arg, tuple) else arg)
+                pos += 1
+            pos += 1
+        elif keyword in ('include', 'substitute') and pos < len(tokens):
+            # These take their string argument without brackets.
+            args.append(tokens[pos][0])
+            pos += 1
+        body = None
+        if pos < len(tokens) and tokens[pos] == '{':
+            body, pos = _Parse(tokens, pos + 1, filename)
+            assert pos < len(tokens), 'Missing } in %s' % filename
+            pos += 1
+        definitions.append((keyword, args, body))
+    return definitions, pos
+
+
+# Returns the path of filename, searching the directories of path in turn if
+# it is not absolute.
+def _FindFile(filename, path):
+    for directory in path:
+        full_name = os.path.join(directory, filename)
+        if os.path.isfile(full_name):
+            return full_name
+    assert False, 'Can\'t find %s in %s' % (filename, ':'.join(path))
+
+
+## Parses a dbd or db file into a list of (keyword, args, body) definitions,
+# where body is a list of definitions or None.  Included files are searched
+# for in the directory of the including file and then in the directories of
+# \c path, and their definitions replace the include statement, which may
+# also appear inside a body.  If \c macros is given then macros are expanded
+# before parsing.
+def ParseFile(filename, path = [], macros = None):
+    return _ParseFile(filename, path, macros, set())
+
+def _ParseFile(filename, path, macros, active):
+    filename = os.path.abspath(filename)
+    assert filename not in active, 'Recursive include of %s' % filename
+    text = open(filename).read()
+    if macros is not None:
+        text = ExpandMacros(text, macros)
+    tokens = _Tokenise(text, filename)
+    parsed, pos = _Parse(tokens, 0, filename)
+    assert pos == len(tokens), 'Unexpected } in %s' % filename
+    return _Include(parsed, filename, path, macros, active | set([filename]))
+
+# Replaces the include statements in definitions by the definitions of the
+# included files.
+def _Include(definitions, filename, path, macros, active):
+    search = [os.path.dirname(filename)] + list(path)
+    result = []
+    for keyword, args, body in definitions:
+        if keyword == 'include':
+            result.extend(_ParseFile(
+                _FindFile(args[0], search), path, macros, active))
+        else:
+            if body is not None:
+                body = _Include(body, filename, path, macros, active)
+            result.append((keyword, args, body))
+    return result
+
+
+## Returns a dictionary of the record types defined by a dbd file.  Each
+# record type is a list of (field name, field type, attributes) tuples in
+# order, where attributes is a dictionary of the field's attributes such as
+# \c size and \c initial.
+def RecordTypes(filename, path = []):
+    record_types = {}
+    for keyword, args, body in ParseFile(filename, path):
+        if keyword == 'recordtype' and body is not None:
+            fields = []
+            for field, field_args, attributes in body:
+                if field == 'field':
+                    fields.append((field_args[0], field_args[1], dict(
+                        (name, (values or [None])[0])
+                        for name, values, _ in attributes or [])))
+            record_types[args[0]] = fields
+    return record_types
+
+
+## Returns the records defined by a db file as a list of (record type, record
+# name, fields) tuples, where fields is a dictionary of field values.  Macros
+# in the file are expanded from \c macros.
+def Records(filename, path = [], macros = {}):
+    records = []
+    for keyword, args, body in ParseFile(filename, path, macros):
+        if keyword in ('record', 'grecord'):
+            fields = {}
+            for field, field_args, _ in body or []:
+                if field == 'field' and len(field_args) == 2:
+                    fields[field_args[0]] = field_args[1]
+            records.append((args[0], args[1], fields))
+    return records
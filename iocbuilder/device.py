@@ -41,6 +41,7 @@ class _FIRST:
     def __hash__(self):     return id(self)
     def __lt__(self, other):
         return self is not other
+    def __str__(self):      return 'FIRST'
 
 _FIRST = _FIRST()
 
@@ -171,8 +172,7 @@ class Device(libversion.ModuleBase):
     # is load the binary files.
     @classmethod
     def _LoadLibraries(cls):
-        if cls.BinFileList or Configure.dynamic_load and (
-                cls.LibFileList or cls.DbdFileList):
+        if cls._HasLibraries():
             print()
             print(('# %s' % cls.__name__))
             print(('cd "%s"' % cls.LibPath()))
@@ -181,6 +181,12 @@ class Device(libversion.ModuleBase):
             if Configure.dynamic_load:
                 cls.__LoadDynamicFiles()
 
+    # Returns True if _LoadLibraries generates any code.
+    @classmethod
+    def _HasLibraries(cls):
+        return bool(cls.BinFileList or Configure.dynamic_load and (
+            cls.LibFileList or cls.DbdFileList))
+
     @classmethod
     def __LoadDynamicFiles(cls):
         # This method is only called if dynamic loading is configured.
@@ -221,8 +227,10 @@ class Device(libversion.ModuleBase):
         cls._InitialisationPhases = phases
 
 
-    # Calls the initialisation methods for the selected phase if present.
-    def _CallInitialise(self, phase):
+    # Returns the names of the InitialiseOnce and Initialise methods for the
+    # selected phase.
+    @staticmethod
+    def _InitialiseNames(phase):
         # The phase suffix is computed from the phase: __n for negative phases,
         # _n for positive phases, empty for (default) phase 0.
         if phase == _FIRST:
@@ -233,8 +241,20 @@ class Device(libversion.ModuleBase):
             suffix = '_%d' % phase
         else:
             suffix = ''
-        InitialiseOnce = 'InitialiseOnce%s' % suffix
-        Initialise = 'Initialise%s' % suffix
+        return 'InitialiseOnce%s' % suffix, 'Initialise%s' % suffix
+
+    # Returns True if _CallInitialise for the selected phase would generate
+    # any code.
+    def _HasInitialise(self, phase):
+        InitialiseOnce, Initialise = self._InitialiseNames(phase)
+        return \
+            hasattr(self, InitialiseOnce) and phase not in self._OncePhases or \
+            hasattr(self, Initialise) or \
+            phase == 0 and bool(self.__Commands)
+
+    # Calls the initialisation methods for the selected phase if present.
+    def _CallInitialise(self, phase):
+        InitialiseOnce, Initialise = self._InitialiseNames(phase)
 
         header = _header('')
         if hasattr(self, InitialiseOnce):
@@ -16,7 +16,12 @@ __all__ = ['create_fanout', 'create_dfanout']
 # dfanout.
 def _fanout_helper(
     fanout_name, link_list, fanout_size,
-    record_factory, field_name, fixup_link, firstargs, nextargs):
+    record_factory, field_name, fixup_link, firstargs, nextargs, tree = False):
+
+    if tree:
+        return _fanout_tree_helper(
+            fanout_name, link_list, fanout_size,
+            record_factory, field_name, fixup_link, firstargs, nextargs)
 
     # First break the list of links into chunks small enough for each fanout
     # record.  First chop it into segments small enough to fit into each
@@ -52,6 +57,77 @@ def _fanout_helper(
     return recordList
 
 
+# The links of one fanout record in a tree: each entry is either a link or a
+# _FanoutNode for another fanout record.
+class _FanoutNode(list):
+    pass
+
+
+# Arranges link_list into a tree of _FanoutNode with no more than fanout_size
+# entries each, as shallow as possible and then with as few nodes as possible.
+# The links are processed in the original order.
+def _fanout_tree(link_list, fanout_size):
+    count = len(link_list)
+    if count <= fanout_size:
+        return _FanoutNode(link_list)
+
+    # Find the number of links each subtree can take without making the tree
+    # any deeper than it has to be.
+    capacity = 1
+    while capacity * fanout_size < count:
+        capacity *= fanout_size
+    # Link as many records as possible directly, leaving enough fields for
+    # subtrees to take the rest.
+    direct = 0
+    while direct + 1 + -(-(count - direct - 1) // capacity) <= fanout_size:
+        direct += 1
+    node = _FanoutNode(link_list[:direct])
+    # Share the remaining links evenly between the subtrees.
+    rest = link_list[direct:]
+    subtrees = -(-len(rest) // capacity)
+    for i in range(subtrees):
+        links = rest[i * len(rest) // subtrees : (i + 1) * len(rest) // subtrees]
+        if len(links) == 1:
+            node.extend(links)
+        else:
+            node.append(_fanout_tree(links, fanout_size))
+    return node
+
+
+# Builds a balanced tree of fanout records, returning the list of records with
+# the root first.  Records are numbered breadth first.
+def _fanout_tree_helper(
+    fanout_name, link_list, fanout_size,
+    record_factory, field_name, fixup_link, firstargs, nextargs):
+
+    # List the nodes breadth first: the list is extended as we go.
+    nodes = [_fanout_tree(list(link_list), fanout_size)]
+    for node in nodes:
+        nodes.extend(entry for entry in node
+            if isinstance(entry, _FanoutNode))
+
+    # Create a fanout record for each node, the first gets the standard name
+    # and a different set of record arguments.
+    recordList = []
+    records = {}
+    for i, node in enumerate(nodes):
+        name = fanout_name
+        if i > 0:
+            name += str(i)
+        record = record_factory(name, **(nextargs if i else firstargs))
+        records[id(node)] = record
+        recordList.append(record)
+
+    # Link each record to its links and to the records below it.
+    for node, record in zip(nodes, recordList):
+        for i, entry in enumerate(node):
+            if isinstance(entry, _FanoutNode):
+                entry = fixup_link(records[id(entry)])
+            setattr(record, field_name(i), entry)
+
+    return recordList
+
+
 
 ## Creates one or more fanout records (as necessary) to fan processing out to
 # a list of records.  If no more than 6 records are given then this creates a
@@ -63,9 +139,14 @@ def _fanout_helper(
 #   appended to this name.
 # \param *record_list
 #   List of records to be processed.
+# \param tree
+#   If set the records are arranged as a balanced tree below the first record
+#   rather than a chain, so the last record is processed after a number of
+#   fanouts which grows with the logarithm of the number of records rather
+#   than in proportion to it.  Records are numbered breadth first.
 # \param **args
 #   Extra field definitions to be passed to the generated fanout records.
-def create_fanout(name, *record_list, **args):
+def create_fanout(name, *record_list, tree = False, **args):
     # We can only support fanout to "All" style fanout records: to generate
     # masked or selected fanouts we'd need to create a cluster of supporting
     # calc records and structure the set rather differently.
@@ -81,7 +162,7 @@ def create_fanout(name, *record_list, **args):
     def identity(x):    return x
     record_list = _fanout_helper(
         name, record_list, 6, records.fanout, fieldname,
-        identity, firstargs, nextargs)
+        identity, firstargs, nextargs, tree)
     return record_list[0]
 
 
@@ -96,9 +177,12 @@ def create_fanout(name, *record_list, **args):
 #   appended to this name.
 # \param *record_list
 #   List of records to be processed.
+# \param tree
+#   If set the records are arranged as a balanced tree, as for
+#   create_fanout().
 # \param **args
 #   Extra field definitions to be passed to the generated fanout records.
-def create_dfanout(name, *record_list, **args):
+def create_dfanout(name, *record_list, tree = False, **args):
     # All records after the first argument must operate passively and in
     # supervisory mode as they are simply mirroring the first record.
     firstargs = args
@@ -110,5 +194,5 @@ def create_dfanout(name, *record_list, **args):
     def fieldname(i):   return 'OUT%c' % (ord('A') + i)
     record_list = _fanout_helper(
         name, record_list, 8, records.dfanout, fieldname,
-        PP, firstargs, nextargs)
+        PP, firstargs, nextargs, tree)
     return record_list[0]
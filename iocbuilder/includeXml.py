@@ -1,11 +1,12 @@
 '''Xml for creating instances of templated xml files.'''
 
 import os
-import xml.dom.minidom
+import re
+import xml.etree.ElementTree as ET
 
 from iocbuilder.libversion import ModuleBase
-from iocbuilder import arginfo, dbd, libversion, support
-from iocbuilder.autosubst import populate_class
+from iocbuilder import arginfo, catalog, dbd, libversion, support
+from iocbuilder.autosubst import populate_class, AutoClassPlaceholder
 
 __all__ = ['Xml']
 
@@ -36,6 +37,12 @@ class Xml(ModuleBase):
     def fromModuleVersion(cls, moduleVersion):
         '''Make autosubstitution objects for all files in the makeIocs dir
         of moduleVersion object'''
+        # As for AutoSubstitution, wait until custom builder objects for
+        # this module are known.
+        if not moduleVersion.IsLoaded():
+            moduleVersion.AddLoadHook(
+                lambda: cls.fromModuleVersion(moduleVersion))
+            return
         path = os.path.join(moduleVersion.LibPath(), 'etc', 'makeIocs')
         if os.path.isdir(path):
             # for each xml file
@@ -47,14 +54,17 @@ class Xml(ModuleBase):
                 # for it
                 if os.path.join(path, xml) in cls.TemplateFiles:
                     continue
-                # make an Xml for it
+                # make a placeholder for its Xml
                 clsname = libversion.PythonIdentifier(
                     'auto_xml_' + xml.split('.')[0])
-                class temp(Xml):
-                    ModuleName = moduleVersion.Name()
-                    TemplateFile = xml
-                    TrueName = clsname
-                setattr(moduleVersion.module, clsname, temp)
+                def create(xml=xml, clsname=clsname):
+                    class temp(Xml):
+                        ModuleName = moduleVersion.Name()
+                        TemplateFile = xml
+                        TrueName = clsname
+                    return temp
+                AutoClassPlaceholder(
+                    moduleVersion, clsname, os.path.join(path, xml), create)
 
     ## Creates an Xml instance with the given arguments.  The
     # arguments need to match the arguments expected by the template to
@@ -77,42 +87,153 @@ class Xml(ModuleBase):
         # Store the args
         self.args = args
 
-        # read in the xml file
-        xml = self.ModuleFile(
-            os.path.join('etc', 'makeIocs', self.TemplateFile))
-        xml_text = open(xml).read()
+        # find the compiled xml file
+        xml = os.path.join(
+            self.LibPath(), 'etc', 'makeIocs', self.TemplateFile)
+        template = _compiledTemplates.get(xml)
+        if template is None:
+            template = _CompiledTemplate(self.ModuleFile(
+                os.path.join('etc', 'makeIocs', self.TemplateFile)))
+            _compiledTemplates[xml] = template
 
-        # substitute the args
+        # work out the substitutions for the args
         obs = {}
-        if args:
-            msi_args = {}
-            # mimic local variables by only passing in obs that are in args
-            for k, v in list(args.items()):
-                if getattr(self.ArgInfo.descriptions[k], 'ident', False):
-                    # for idents, make msi sub $(CAM)=CAM and add CAM to list
-                    # of objects
-                    obs[k] = v
-                    msi_args[k] = k
-                else:
-                    # otherwise just do a straight text substitution
-                    msi_args[k] = v
-            xml_text = support.msi_replace_macros(msi_args, xml_text)
+        msi_args = {}
+        # mimic local variables by only passing in obs that are in args
+        for k, v in list(args.items()):
+            if getattr(self.ArgInfo.descriptions[k], 'ident', False):
+                # for idents, make msi sub $(CAM)=CAM and add CAM to list
+                # of objects
+                obs[k] = v
+                msi_args[k] = k
+            else:
+                # otherwise just do a straight text substitution
+                msi_args[k] = v
+        components = template.Expand(msi_args)
 
         # make iocbuilder objects
         if libversion.Debug:
             print(('< Loading objects from %s >' % self.TemplateFile))
-        self.objects = instantiateXml(xml_text, obs)
+        if components is not None:
+            self.objects = _instantiate(components, obs)
+        else:
+            # The template or arguments need the full msi treatment
+            xml_text = open(xml).read()
+            if args:
+                xml_text = support.msi_replace_macros(msi_args, xml_text)
+            self.objects = instantiateXml(xml_text, obs)
         if libversion.Debug:
             print(('</ Loading objects from %s >' % self.TemplateFile))
 
 
+## An Xml template parsed once into its component elements, with the macros
+# in their attribute values marked, so that instances can be expanded
+# without running msi or parsing the template again.  Only simple macro
+# references are handled this way: templates using any other msi syntax,
+# and arguments whose values msi would treat specially, are left to msi.
+class _CompiledTemplate(object):
+    def __init__(self, filename):
+        # List of (tag, [(attr, segments)]) for each component, where
+        # segments is a list of strings and (name, default, text) macro
+        # references, or None if the template can't be compiled.
+        self.components = None
+        text = open(filename).read()
+        # As for msi_replace_macros, msi is only run if there's a $( in the
+        # template, so ${NAME} on its own is left alone.
+        self.__msi = '$(' in text
+        if '$' in _simple_macro.sub('', text) or \
+                _msi_directive.search(text) or '&#' in text:
+            return
+        try:
+            root = ET.fromstring(text)
+        except ET.ParseError:
+            return
+        self.components = [
+            (node.tag, [
+                (attr, self.__Segments(value))
+                for attr, value in node.attrib.items()])
+            for node in root]
+
+    def __Segments(self, value):
+        segments = []
+        last = 0
+        for match in _simple_macro.finditer(value):
+            segments.append(value[last:match.start()])
+            name = match.group(1) or match.group(3)
+            default = match.group(2)
+            if default is None:
+                default = match.group(4)
+            segments.append((name, default, match.group()))
+            last = match.end()
+        segments.append(value[last:])
+        return [segment for segment in segments if segment != '']
+
+    ## Returns a list of the components of the template as ElementTree
+    # elements with the given macros substituted, or None if msi is needed.
+    def Expand(self, macros):
+        if self.components is None:
+            return None
+        values = {}
+        for name, value in macros.items():
+            value = str(value)
+            if _msi_special.search(value):
+                return None
+            values[name] = value
+        components = []
+        for tag, attributes in self.components:
+            attrib = {}
+            for attr, segments in attributes:
+                text = []
+                for segment in segments:
+                    if isinstance(segment, str):
+                        text.append(segment)
+                    elif not macros or not self.__msi:
+                        # Without arguments or $( msi isn't run at all
+                        text.append(segment[2])
+                    elif segment[0] in values:
+                        text.append(values[segment[0]])
+                    elif segment[1] is not None:
+                        text.append(segment[1])
+                    else:
+                        # msi reports undefined macros
+                        return None
+                attrib[attr] = ''.join(text)
+            components.append(ET.Element(tag, attrib))
+        return components
+
+# Matches $(NAME), ${NAME}, $(NAME=default) and ${NAME=default} where the
+# default contains no further macros.
+_simple_macro = re.compile(
+    r'\$(?:\(([A-Za-z0-9_]+)(?:=([^$()]*))?\)|'
+    r'\{([A-Za-z0-9_]+)(?:=([^${}]*))?\})')
+
+# Matches the include and substitute directives of msi
+_msi_directive = re.compile(r'^\s*(include|substitute)\b', re.MULTILINE)
+
+# Matches characters in macro values which msi or the xml parser would
+# interpret rather than substitute literally.
+_msi_special = re.compile(r'[$&<>"\'\\,\t\n\r]')
+
+# Compiled Xml templates, indexed by file name.
+_compiledTemplates = {}
+
+
+# Returns the name and the list of (attribute, value) pairs of el, which can
+# be either a minidom or an ElementTree element.
+def _elementContents(el):
+    if hasattr(el, 'attrib'):
+        return el.tag, list(el.attrib.items())
+    else:
+        return el.nodeName, list(el.attributes.items())
+
 def constructArgDict(el, objects, classes, ident_lookup=True):
     # dict of args to return
     d = {}
     # name of object represented by this element
     name = None
     # get the object class
-    obname = str(el.nodeName)
+    obname, attributes = _elementContents(el)
+    obname = str(obname)
     assert obname in classes, 'Can\'t find object "%s"'% obname
     ob = classes[obname]
     # find the column representing name
@@ -120,7 +241,7 @@ def constructArgDict(el, objects, classes, ident_lookup=True):
     # see if this nameKey also needs to be passed to the object constructor
     needsNameKey = nameKey in ob.ArgInfo.descriptions
     # build up the arg dict
-    for attr, value in list(el.attributes.items()):
+    for attr, value in attributes:
         attr = str(attr)
         value = str(value)
         # check if this is the name key
@@ -157,51 +278,137 @@ def constructArgDict(el, objects, classes, ident_lookup=True):
         d[attr] = value
     return name, ob, d
 
+# Creates a class wrapping the given record type with an ArgInfo describing
+# its fields.
+def _recordClass(recordtype):
+    cls = getattr(dbd.records, recordtype)
+    simple = arginfo.Simple
+    # construct an ArgInfo object
+    argInfo = arginfo.makeArgInfo(
+        ['record'], list(cls.FieldInfo().keys()),
+        record = simple('Record name', str),
+        **cls.FieldInfo())
+    class o(object):
+        r = cls
+        def __init__(self, record, **args):
+            self.r(record, **args)
+        ModuleName = 'records'
+        ArgInfo = argInfo
+    o.__name__ = recordtype
+    return o
+
+# Adds o to the class dict if it can be created from xml
+def _addClass(classes, o):
+    # make sure we have an ArgInfo
+    if not hasattr(o, 'ArgInfo') or o.__name__.startswith('_'):
+        return
+    # add it to our class dict
+    name = o.ModuleName + '.' + o.__name__
+    # Special case names that start with a digit as they aren't valid xml idents
+    if name and name[0].isdigit():
+        name = "_" + name
+    classes[name] = o
+
+## Returns a dict of all the classes that can be created from xml, indexed by
+# their xml element name.  The result is cached: record types and module
+# classes added since the last call are added to it, and it is only rebuilt
+# when classes are replaced or removed.
 def createClassLookup():
-    classes = {}
-    # create some record classes
-    records = []
+    global _lookupGeneration, _lookupCount
+    # create some record classes, reusing those already made
+    records = {}
     for recordtype in dbd.records.GetRecords():
-        cls = getattr(dbd.records, recordtype)
-        simple = arginfo.Simple
-        # construct an ArgInfo object
-        argInfo = arginfo.makeArgInfo(
-            ['record'], list(cls.FieldInfo().keys()),
-            record = simple('Record name', str),
-            **cls.FieldInfo())
-        class o(object):
-            r = cls
-            def __init__(self, record, **args):
-                self.r(record, **args)
-            ModuleName = 'records'
-            ArgInfo = argInfo
-        o.__name__ = recordtype
-        # add it to our list
-        records.append(o)
+        o = _recordClasses.get(recordtype)
+        if o is None or o.r is not getattr(dbd.records, recordtype):
+            o = _recordClass(recordtype)
+            _recordClasses[recordtype] = o
+        _addClass(records, o)
+    # update the module class dict, using the catalog for modules not yet
+    # loaded
+    if _lookupGeneration != libversion.ClassGeneration:
+        _lookupClasses.clear()
+        new = ModuleBase.ModuleBaseClasses + catalog.Classes() + \
+            libversion.Placeholders()
+        _lookupGeneration = libversion.ClassGeneration
+    else:
+        new = ModuleBase.ModuleBaseClasses[_lookupCount:]
+    _lookupCount = len(ModuleBase.ModuleBaseClasses)
+    for o in new:
+        _addClass(_lookupClasses, o)
     # create the class dict
-    for o in ModuleBase.ModuleBaseClasses + records:
-        # make sure we have an ArgInfo
-        if not hasattr(o, 'ArgInfo') or o.__name__.startswith('_'):
-            continue
-        # add it to our class dict
-        name = o.ModuleName + '.' + o.__name__
-        # Special case names that start with a digit as they aren't valid xml idents
-        if name and name[0].isdigit():
-            name = "_" + name
-        classes[name] = o
+    classes = dict(_lookupClasses)
+    classes.update(records)
     return classes
 
-def instantiateXml(xml_text, objects=None):
-    if objects is None:
-        objects = {}
+# Cache for createClassLookup(): record classes indexed by record type, and
+# the class dict for modules as of the given class generation and number of
+# ModuleBase classes.
+_recordClasses = {}
+_lookupClasses = {}
+_lookupGeneration = None
+_lookupCount = 0
+
+# Ensures that the module providing the named object is loaded before it is
+# looked up, returning the class dict updated if necessary.  Modules declared
+# with lazy loading only define their classes when first used.
+def _loadClassFor(obname, classes):
+    if obname not in classes:
+        # Undo the special casing of names starting with a digit
+        if obname[:1] == '_' and obname[1:2].isdigit():
+            obname = obname[1:]
+        module = obname.split('.', 1)[0]
+        # no point loading a module whose classes are all catalogued
+        if not catalog.IsCatalogued(module) and \
+                libversion.LoadModule(module):
+            classes = createClassLookup()
+    return classes
+
+# Size of the chunks in which xml files are read.
+_ChunkSize = 1 << 16
+
+# Returns the contents of filename as a series of chunks of bytes.
+def _readChunks(filename):
+    with open(filename, 'rb') as input:
+        while True:
+            chunk = input.read(_ChunkSize)
+            if not chunk:
+                break
+            yield chunk
+
+## Parses xml from an iterable of chunks of text, yielding the root element
+# as soon as it starts, and then each of its children (the components) as
+# each is completed.  Components are detached from the root once the caller
+# has finished with them, so the whole document is never held in memory.
+def iterComponents(chunks):
+    parser = ET.XMLPullParser(['start', 'end'])
+    root = None
+    depth = 0
+    def events():
+        nonlocal root, depth
+        for event, el in parser.read_events():
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = el
+                    yield el
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield el
+                    root.remove(el)
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from events()
+    parser.close()
+    yield from events()
 
-    xml_root = xml.dom.minidom.parseString(xml_text)
-    # find the root node
-    components = support.elements(xml_root)[0]
+# Instantiates the given component elements.
+def _instantiate(components, objects):
     # create class dict
     classes = createClassLookup()
-    # find elements under it
-    for node in support.elements(components):
+    # instantiate each component as it is parsed
+    for node in components:
+        classes = _loadClassFor(str(node.tag), classes)
         # lookup arguments
         name, ob, d = constructArgDict(node, objects, classes)
         # instantiate it
@@ -212,3 +419,107 @@ def instantiateXml(xml_text, objects=None):
             if libversion.Debug:
                 print(('Setting %s = %s' %(name, inst)))
     return objects
+
+def instantiateXml(xml_text, objects=None):
+    if objects is None:
+        objects = {}
+    components = iterComponents([xml_text])
+    # skip the root node
+    next(components)
+    return _instantiate(components, objects)
+
+## Instantiates the components described by the xml file filename, reading
+# the file incrementally.  Returns the dictionary of named objects.
+def instantiateXmlFile(filename, objects=None):
+    if objects is None:
+        objects = {}
+    components = iterComponents(_readChunks(filename))
+    # skip the root node
+    next(components)
+    return _instantiate(components, objects)
+
+# Returns a description of the problem converting value for the argument
+# described by desc as constructArgDict() would, or None if there is none.
+# Values containing macros are left for msi to check.
+def _checkValue(value, desc):
+    if '$(' in value or '${' in value:
+        return None
+    if desc.typ == bool:
+        # anything is true or false
+        return None
+    elif desc.typ == str:
+        try:
+            typed = value.encode('utf-8').decode('unicode-escape')
+        except UnicodeDecodeError as e:
+            return 'Invalid escape in "%s": %s' % (value, e)
+    else:
+        try:
+            typed = desc.typ(value)
+        except (TypeError, ValueError):
+            return 'Cannot convert "%s" to %s' % (value, desc.typ)
+    if hasattr(desc, 'values'):
+        if typed not in desc.values:
+            return '"%s" is not a supported enum' % value
+    elif hasattr(desc, 'labels'):
+        if typed not in desc.labels:
+            return '"%s" is not a supported choice' % value
+    return None
+
+## Checks component elements against the ArgInfo of their classes as
+# constructArgDict() would, but without creating any objects, and returns a
+# list of all the problems found.  As well as checking argument names and
+# types, this checks that required arguments are given, that choices are
+# valid, that object names are unique and that identifiers refer to objects
+# defined earlier.
+def validateComponents(components):
+    errors = []
+    # names of objects defined so far
+    names = set()
+    classes = createClassLookup()
+    for index, el in enumerate(components):
+        obname, attributes = _elementContents(el)
+        obname = str(obname)
+        where = '%s (component %d)' % (obname, index + 1)
+        classes = _loadClassFor(obname, classes)
+        if obname not in classes:
+            errors.append('%s: Can\'t find object "%s"' % (where, obname))
+            continue
+        ob = classes[obname]
+        descriptions = ob.ArgInfo.descriptions
+        nameKey = getattr(ob, 'UniqueName', 'name')
+        given = set()
+        for attr, value in attributes:
+            attr = str(attr)
+            value = str(value)
+            if attr == nameKey:
+                where = '%s "%s"' % (obname, value)
+                if value in names:
+                    errors.append('%s: Object with name "%s" already exists'
+                        % (where, value))
+                names.add(value)
+                if nameKey not in descriptions:
+                    continue
+            given.add(attr)
+            if attr not in descriptions:
+                errors.append('%s: %s is not a valid argument' % (where, attr))
+            elif getattr(descriptions[attr], 'ident', False):
+                if value not in names:
+                    errors.append('%s: Can\'t perform identifier lookup on '
+                        '"%s"' % (where, value))
+            else:
+                problem = _checkValue(value, descriptions[attr])
+                if problem:
+                    errors.append('%s.%s: %s' % (where, attr, problem))
+        for attr in ob.ArgInfo.required_names:
+            if attr not in given:
+                errors.append('%s: Required argument %s not given' % (
+                    where, attr))
+    return errors
+
+## Validates the xml file filename with validateComponents(), reading it
+# incrementally.  Returns the list of problems found.
+def validateXmlFile(filename):
+    components = iterComponents(_readChunks(filename))
+    # skip the root node
+    next(components)
+    return validateComponents(components)
@@ -24,10 +24,13 @@
 #   AddIocFile(filename)
 #       Adds file to be copied into IOC directory tree.
 
+import codecs
+import errno
+import hashlib
 import os
 import shutil
 
-from iocbuilder import mydbstatic, paths, support
+from iocbuilder import dbd, mydbstatic, paths, recordset, support
 from iocbuilder.support import autosuper, quote_c_string
 from iocbuilder.liblist import Hardware
 from iocbuilder.libversion import ModuleVersion
@@ -70,6 +73,52 @@ def setenv_vxWorks(name, value):
     print(('putenv ' + quote_c_string('%s=%s' % (name, value))))
 
 
+# Boot timing markers.  Each section of the startup script is preceded by a
+# line "@@BOOT <section>" in the boot log followed by the time, or on vxWorks
+# by a single line "@@BOOT <section> <ticks>" after an initial line
+# "@@BOOT-RATE <ticks per second>".  toolkit/boot_timing.py turns the log
+# into a timing table.
+def boot_mark_linux(section):
+    print('echo %s' % quote_IOC_string('@@BOOT %s' % section))
+    print('date')
+boot_mark_win32 = boot_mark_linux
+boot_mark_windows = boot_mark_linux
+
+def boot_mark_vxWorks(section):
+    print('printf %s, tickGet()' %
+        quote_c_string('@@BOOT %s %%d\n' % section.replace('%', '%%')))
+
+
+## Default sizing of the callback and scan once queues used by
+# \ref iocInit.AutoSizeQueues "AutoSizeQueues": room for every request to be
+# queued twice over, but never less than the EPICS default.
+def DefaultQueueSize(requests, default):
+    return max(default, 2 * requests)
+
+# EPICS default sizes of the callback and scan once queues.
+_DefaultCallbackQueueSize = 2000
+_DefaultScanOnceQueueSize = 1000
+
+
+# Counts the records of the IOC which make requests on the callback queue,
+# those scanned on I/O Intr or Event, and the CP links, which make requests on
+# the scan once queue.  Only input link fields are counted as CP links, except
+# for record types not loaded from any dbd file, where any field might be.
+def _CountQueueRequests():
+    callbacks = 0
+    cp_links = 0
+    for record_type, name, fields in recordset.ExpandedRecords():
+        if fields.get('SCAN') in ('I/O Intr', 'Event'):
+            callbacks += 1
+        record = getattr(dbd.records, record_type, None)
+        link_fields = record and record.LinkFields()
+        for field, value in fields.items():
+            if (link_fields is None or link_fields.get(field) == 'INLINK') \
+                    and set(value.split()[1:]) & set(['CP', 'CPP']):
+                cp_links += 1
+    return callbacks, cp_links
+
+
 ## Container for IOC initialisation functions.
 class iocInit(support.Singleton):
     DefaultEnvironment = { 'EPICS_TS_MIN_WEST' : 0 }
@@ -92,6 +141,12 @@ class iocInit(support.Singleton):
 	# List of commands to run in startup script before IOC boot
         self.__PreBootCommands = []
 
+        # Function sizing the callback and scan once queues, if enabled
+        self.__QueueSize = None
+
+        # Whether to mark each section of the startup script for boot timing
+        self.__BootTiming = False
+
 
     def Initialise(self):
         # We can't import the IOC until we've finished importing (at least,
@@ -104,10 +159,12 @@ class iocInit(support.Singleton):
 
         # Now the architecture has been set (assuming it has), set up the
         # appropriate IOC string quoting function.
-        global quote_IOC_string, print_setenv
+        global quote_IOC_string, print_setenv, print_boot_mark
         quote_IOC_string = Get_TargetOS_dict(
             globals(), 'quote_IOC_string', _no_architecture)
         print_setenv = Get_TargetOS_dict(globals(), 'setenv', _no_architecture)
+        print_boot_mark = Get_TargetOS_dict(
+            globals(), 'boot_mark', _no_architecture)
 
 
     def SetIocName(self, ioc_name, substitute_boot = False):
@@ -165,6 +222,10 @@ class iocInit(support.Singleton):
             print(('sysClkRateSet %d' % self.__ClockRate))
         if self.__Gateway:
             print(('routeAdd "0", %s' % quote_IOC_string(self.__Gateway)))
+        if self.__BootTiming:
+            if TargetOS() == 'vxWorks':
+                print('printf "@@BOOT-RATE %d\\n", sysClkRateGet()')
+            print_boot_mark('start')
 
 
     def PrintFooter(self):
@@ -173,8 +234,12 @@ class iocInit(support.Singleton):
         print('# ------------------------')
         self.cd_home()
         for database in self.__DatabaseNameList:
+            self.__BootMark('dbLoadRecords %s' % database)
             print(('dbLoadRecords %s' % quote_IOC_string(database)))
 
+        if self.__QueueSize:
+            self.PrintQueueSizes()
+
         if self.__IocCommands_PreInit:
             print()
             print('# Extra IOC commands')
@@ -182,7 +247,9 @@ class iocInit(support.Singleton):
                 print(command)
             print()
 
+        self.__BootMark('iocInit')
         print('iocInit')
+        self.__BootMark('post-init')
 
         if self.__IocCommands_PostInit:
             print()
@@ -192,12 +259,35 @@ class iocInit(support.Singleton):
             print()
 
 
-    # Writes out a complete IOC startup script.
-    def PrintIoc(self, ioc_root=None):
-        self.PrintHeader(ioc_root)
-        Hardware.PrintBody()
-        self.PrintFooter()
-        Hardware.PrintPostIocInit()
+    def PrintQueueSizes(self):
+        callbacks, cp_links = _CountQueueRequests()
+        print()
+        print('# Queue sizes for %d I/O Intr and Event records and %d CP '
+            'links' % (callbacks, cp_links))
+        print('callbackSetQueueSize %d' % self.__QueueSize(
+            callbacks, _DefaultCallbackQueueSize))
+        print('scanOnceSetQueueSize %d' % self.__QueueSize(
+            cp_links, _DefaultScanOnceQueueSize))
+
+    def __BootMark(self, section):
+        if self.__BootTiming:
+            print_boot_mark(section)
+
+    # Writes out a complete IOC startup script.  If boot_timing is set then
+    # each section of the script is marked for boot timing, otherwise this is
+    # as set by SetBootTiming.
+    def PrintIoc(self, ioc_root=None, boot_timing=None):
+        saved = self.__BootTiming
+        if boot_timing is not None:
+            self.__BootTiming = boot_timing
+        try:
+            self.PrintHeader(ioc_root)
+            Hardware.PrintBody(self.__BootTiming and self.__BootMark or None)
+            self.PrintFooter()
+            Hardware.PrintPostIocInit()
+            self.__BootMark('done')
+        finally:
+            self.__BootTiming = saved
 
 
 
@@ -254,6 +344,29 @@ class iocInit(support.Singleton):
                 key, self.__EnvList[key], value)))
         self.__EnvList[key] = value
 
+    ## Sizes the callback and scan once queues in the startup script from the
+    # number of records using them.  The records scanned on I/O Intr or Event
+    # are counted for the callback queue and the CP links for the scan once
+    # queue, including records expanded from substitutions.
+    #
+    # \param size
+    #   Function called as \c size(requests, default) for each queue, where
+    #   \c requests is the count and \c default the EPICS default size of
+    #   the queue, returning the queue size.  Defaults to
+    #   \ref DefaultQueueSize.  Pass None to stop sizing the queues.
+    @export
+    def AutoSizeQueues(self, size = DefaultQueueSize):
+        self.__QueueSize = size
+
+    ## Marks the start of each section of the startup script, the loading of
+    # each library, each device initialisation phase, each database load,
+    # iocInit and the post-init commands, with the time.  The boot log can
+    # then be turned into a table of the time taken by each section with
+    # \c dls-boot-timing.py.
+    @export
+    def SetBootTiming(self, boot_timing=True):
+        self.__BootTiming = boot_timing
+
     ## Adds an IOC command to the startup script.
     #
     # Don't do it this way, define a \ref iocbuilder.device.Device "Device"
@@ -267,12 +380,114 @@ class iocInit(support.Singleton):
 
 
 
+# Functions for staging a data file from source to target, tried in turn by
+# IocDataSet.CopyDataFiles until one returns True.  Any existing target has
+# been removed before all but the first is called.
+
+# Leaves the target alone if it is the source or has the same size,
+# modification time and contents.
+def _StageUnchanged(source, target):
+    try:
+        source_stat = os.stat(source)
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    if os.path.samestat(source_stat, target_stat):
+        return True
+    return \
+        source_stat.st_size == target_stat.st_size and \
+        source_stat.st_mtime_ns == target_stat.st_mtime_ns and \
+        _FileHash(source) == _FileHash(target)
+
+def _FileHash(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as input:
+        for block in iter(lambda: input.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+# Hard links the target to the source, which only works on the same file
+# system.  Note that the target then shares its permissions with the source.
+def _StageHardlink(source, target):
+    if os.stat(source).st_dev != os.stat(os.path.dirname(target)).st_dev:
+        return False
+    try:
+        os.link(source, target)
+    except OSError as error:
+        if error.errno not in _Unsupported:
+            raise
+        return False
+    return True
+
+# Errors meaning that a staging method isn't supported here.
+_Unsupported = set([
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EPERM,
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.EMLINK])
+
+# Gives the target the modification time of the source, so that an unchanged
+# source is recognised by the next build.
+def _CopyTimes(source, target):
+    source_stat = os.stat(source)
+    os.utime(target, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+# Copies the source to the target with copy(input, output), returning False if
+# the file system doesn't support this.
+def _StageWith(copy, source, target):
+    try:
+        with open(source, 'rb') as input:
+            with open(target, 'wb') as output:
+                copy(input.fileno(), output.fileno())
+    except OSError as error:
+        if error.errno not in _Unsupported:
+            raise
+        os.remove(target)
+        return False
+    _CopyTimes(source, target)
+    return True
+
+# Ioctl asking Linux to share the blocks of one file with another.
+_FICLONE = 0x40049409
+
+# Copy on write clone of the source, for file systems such as btrfs and xfs.
+def _StageReflink(source, target):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    return _StageWith(
+        lambda input, output: fcntl.ioctl(output, _FICLONE, input),
+        source, target)
+
+# Copies within the kernel, which some file systems do without copying data.
+def _StageCopyRange(source, target):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    def copy(input, output):
+        while os.copy_file_range(input, output, 1 << 30):
+            pass
+    return _StageWith(copy, source, target)
+
+def _StageCopy(source, target):
+    shutil.copyfile(source, target)
+    _CopyTimes(source, target)
+    return True
+
+_StagingMethods = {
+    'unchanged':    _StageUnchanged,
+    'hardlink':     _StageHardlink,
+    'reflink':      _StageReflink,
+    'copy_range':   _StageCopyRange,
+    'copy':         _StageCopy,
+}
+
+
 # This class gathers together files to be placed in the IOC's data
 # directory.
 class IocDataSet(support.Singleton):
     # The following global state is managed as class variables.
     __DataPath = None
     __DataFileList = {}
+    __Staging = None
 
     def SetDataPath(self, DataPath):
         self.__DataPath = DataPath
@@ -281,15 +496,65 @@ class IocDataSet(support.Singleton):
         assert self.__DataPath is not None, 'IOC data path not yet defined'
         return self.__DataPath
 
+    ## Sets how data files are staged into the IOC by CopyDataFiles.  By
+    # default each file is copied afresh, otherwise each of the named methods
+    # is tried in turn, falling back to a plain copy:
+    #
+    #   - \c unchanged: leave a target with the same size, modification time
+    #     and contents as the source.
+    #   - \c hardlink: hard link the target to the source if both are on the
+    #     same file system.
+    #   - \c reflink: clone the source where the file system supports copy
+    #     on write.
+    #   - \c copy_range: copy within the kernel with \c copy_file_range.
+    #   - \c copy: plain copy.
+    #
+    # Files left over in the data directory from earlier builds are removed
+    # when staging is set.  Passing None restores the default.
+    def SetDataStaging(self, methods):
+        if methods is not None:
+            for method in methods:
+                assert method in _StagingMethods, \
+                    'Unknown data staging method %s' % method
+            methods = list(methods)
+        self.__Staging = methods
+
+    def GetDataStaging(self):
+        return self.__Staging
+
     def CopyDataFiles(self, targetDir, make_dirs=False):
         assert self.__DataPath is not None, 'IOC data path not yet defined'
+        targetDir = os.path.join(targetDir, self.__DataPath)
+        if self.__Staging is not None and os.path.isdir(targetDir):
+            for filename in os.listdir(targetDir):
+                if filename not in self.__DataFileList:
+                    filename = os.path.join(targetDir, filename)
+                    if os.path.isdir(filename) and \
+                            not os.path.islink(filename):
+                        shutil.rmtree(filename)
+                    else:
+                        os.remove(filename)
         if self.__DataFileList:
-            targetDir = os.path.join(targetDir, self.__DataPath)
             if make_dirs:
-                os.makedirs(targetDir)
+                os.makedirs(targetDir, exist_ok=True)
             for filename, file_object in list(self.__DataFileList.items()):
                 file_object._CopyFile(os.path.join(targetDir, filename))
 
+    def _StageFile(self, source, target):
+        if self.__Staging is None:
+            shutil.copyfile(source, target)
+            return
+        if 'unchanged' in self.__Staging and _StageUnchanged(source, target):
+            return
+        # Never write through an existing target: it may be a hard link.
+        if os.path.lexists(target):
+            os.remove(target)
+        for method in self.__Staging:
+            if method != 'unchanged' and \
+                    _StagingMethods[method](source, target):
+                return
+        _StageCopy(source, target)
+
     def DataFileCount(self):
         return len(self.__DataFileList)
 
@@ -341,7 +606,7 @@ class IocDataFile(_IocDataBase):
         self.__super.__init__(name)
 
     def _CopyFile(self, filename):
-        shutil.copyfile(self.source, filename)
+        IocDataSet._StageFile(self.source, filename)
 
     # Treat two instances wrapping the same file as equal.
     def __cmp__(self, other):   return cmp(self.source, other.source)
@@ -349,7 +614,18 @@ class IocDataFile(_IocDataBase):
 
 ## This is used to package up a data stream which will be written to a freshly
 # generated file at the end of the IOC build process.
+#
+# Each call to write() can pass a string, a callable returning the content
+# when the file is written, or a source which is streamed to the file in
+# chunks so that large content need not be held in memory: either an iterable
+# such as a generator yielding strings, or a file-like object with a \c read
+# method, which is read to the end and closed.  Bytes, whether passed
+# directly or read from a source, are decoded as UTF-8.  Content is written
+# again if the IOC is written more than once, except for iterators and
+# file-like objects, which can only be written once.
 class IocDataStream(_IocDataBase):
+    # Size of the chunks read from file-like content.
+    ChunkSize = 1 << 16
 
     def __init__(self, name, mode=None):
         self.content = []
@@ -363,19 +639,62 @@ class IocDataStream(_IocDataBase):
         self.content.append(text)
 
     def _CopyFile(self, filename):
+        # The data directory may be kept from an earlier build.
+        if os.path.lexists(filename):
+            os.remove(filename)
         output = open(filename, 'w')
-        for content in self.content:
+        for i, content in enumerate(self.content):
+            assert content is not _Consumed, \
+                'Streamed content of %s already written out' % self.name
             if callable(content):
                 content = content()
-            output.write(content)
+            elif hasattr(content, 'read') or iter(content) is content:
+                # Drop the source, which is exhausted once written.
+                self.content[i] = _Consumed
+            self.__WriteContent(output, content)
         output.close()
         if self.mode is not None:
             os.chmod(filename, self.mode)
         self.written = True
 
+    def __WriteContent(self, output, content):
+        if isinstance(content, str):
+            output.write(content)
+            return
+        elif isinstance(content, bytes):
+            output.write(content.decode('utf-8'))
+            return
+        if hasattr(content, 'read'):
+            source = self.__ReadChunks(content)
+        else:
+            source = content
+        # Chunks of bytes may split a character, so decode incrementally.
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for chunk in source:
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            output.write(chunk)
+        output.write(decoder.decode(b'', True))
+
+    def __ReadChunks(self, input):
+        try:
+            while True:
+                chunk = input.read(self.ChunkSize)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if hasattr(input, 'close'):
+                input.close()
+
+
+# Marks the content of an IocDataStream streamed from a source already
+# written out.
+_Consumed = object()
+
 
 # Export all the names exported by iocInit()
-__all__ = ['IocDataFile', 'IocDataStream']
+__all__ = ['IocDataFile', 'IocDataStream', 'DefaultQueueSize']
 for name in _ExportList:
     __all__.append(name)
     globals()[name] = getattr(iocInit, name)
@@ -11,6 +11,7 @@ import textwrap
 import types
 
 from iocbuilder import configure, iocinit, libversion, paths, recordset, support
+from iocbuilder import dbmemory, linkgraph, recordprune, scanload, scanphase
 from iocbuilder.liblist import Hardware
 
 
@@ -243,6 +244,23 @@ class IocWriter:
             filename = os.path.join(*filename)
         WriteFile(os.path.join(self.iocRoot, filename), writer, *argv, **argk)
 
+    # Removes the records which nothing uses, apart from those matching the
+    # patterns in allow, and records their names in the database header.
+    def PruneRecords(self, allow):
+        for name in recordprune.PruneRecords(allow):
+            recordset.RecordSet.AddHeaderLine(
+                '# Pruned unused record %s' % name)
+
+    # Spreads periodically scanned records across scan phases and records the
+    # resulting load of each scan rate in the database header.
+    def BalancePhases(self):
+        for line in scanphase.BalancePhases():
+            recordset.RecordSet.AddHeaderLine(line)
+
+    # Writes a report of the links between the published records.
+    def WriteLinkReport(self, filename):
+        self.WriteFile(filename, linkgraph.LinkGraph().PrintReport)
+
 
     # This method resets only the record data but not the remaining IOC state.
     # This should only be used if incremental record creation without building
@@ -254,6 +272,25 @@ class IocWriter:
 
 
 
+# Removes everything in the directory path except for the given list of paths
+# relative to it.
+def _RemoveContents(path, keep):
+    for name in os.listdir(path):
+        if name in keep:
+            continue
+        filename = os.path.join(path, name)
+        inner = [k.split(os.sep, 1)[1] for k in keep
+            if k.startswith(name + os.sep)]
+        if inner and os.path.isdir(filename) and \
+                not os.path.islink(filename):
+            _RemoveContents(filename, inner)
+        else:
+            try:
+                os.remove(filename)
+            except OSError:
+                shutil.rmtree(filename)
+
+
 ## This is the simplest possible IOC writer.  Two methods are supported,
 # WriteRecords and WriteHardware, which write out respectively the set of
 # generated records and the IOC startup script.
@@ -385,7 +422,9 @@ class DbOnlyWriter(IocWriter):
     # \param *args
     #   Discarded
     # \param **kwargs
-    #   Discarded
+    #   Discarded, apart from \c prune_records, \c prune_allow,
+    #   \c balance_phases and \c link_report which are as for
+    #   \ref DiamondIocWriter.__init__
     def __init__(self, path, ioc_name, *args, **kwargs):
         # Remember parameters
         IocWriter.__init__(self, path)  # Sets up iocRoot
@@ -396,8 +435,14 @@ class DbOnlyWriter(IocWriter):
 
         db = self.ioc_name + '.db'
         substitutions = self.ioc_name + '_expanded.substitutions'
+        if kwargs.get('prune_records', False):
+            self.PruneRecords(kwargs.get('prune_allow', []))
+        if kwargs.get('balance_phases', False):
+            self.BalancePhases()
         if self.CountRecords():
             self.WriteFile(db, self.PrintRecords)
+            if kwargs.get('link_report', False):
+                self.WriteLinkReport(self.ioc_name + '_links.txt')
         if self.CountSubstitutions():
             self.WriteFile(substitutions, self.PrintSubstitutions)
         else:
@@ -554,14 +599,12 @@ EPICS_BASE = %(EPICS_BASE)s
         assert checklist <= set(require_list), \
             'Directory %s doesn\'t appear to be an IOC directory' % \
                 self.iocRoot
-        if self.keep_files:
-            for file in dirlist:
-                if file not in self.keep_files:
-                    file = os.path.join(self.iocRoot, file)
-                    try:
-                        os.remove(file)
-                    except OSError:
-                        shutil.rmtree(file)
+        keep_data = self.data_staging is not None
+        if self.keep_files or keep_data:
+            keep = list(self.keep_files)
+            if keep_data:
+                keep.append(self.iocDataDir)
+            _RemoveContents(self.iocRoot, keep)
         else:
             shutil.rmtree(self.iocRoot)
 
@@ -647,9 +690,50 @@ EPICS_BASE = %(EPICS_BASE)s
     #   the IOC directory is completely erased.
     # \param makefile_name
     #   Name of the makefile for the generated IOC, defaults to \c Makefile.
+    # \param prune_records
+    #   Whether to remove the records which nothing uses before writing the
+    #   database, see \ref recordprune.DeadRecords.  Defaults to False.
+    # \param prune_allow
+    #   List of fnmatch patterns for the names of records used by channel
+    #   access clients, which are never removed.
+    # \param balance_phases
+    #   Whether to spread periodically scanned records across scan phases
+    #   before writing the database, see \ref scanphase.BalancePhases.
+    #   Defaults to False.
+    # \param link_report
+    #   Whether to write a report of the links between records, see
+    #   \ref linkgraph.LinkGraph.Report, to \c <ioc_name>_links.txt next to
+    #   the database.  Defaults to False.
+    # \param memory_report
+    #   Whether to write an estimate of the memory taken by the database, see
+    #   \ref dbmemory.EstimateMemory, to \c <ioc_name>_memory.txt next to the
+    #   database.  Defaults to False.
+    # \param memory_budget
+    #   If set, a RuntimeError is raised before the database is written if
+    #   the estimated database memory exceeds this number of bytes.
+    # \param load_report
+    #   Whether to write an estimate of the processing load of each periodic
+    #   scan rate, see \ref scanload.EstimateScanLoad, to
+    #   \c <ioc_name>_load.txt next to the database.  Defaults to False.
+    # \param load_budget
+    #   If set, a warning is printed if the estimated weighted load of all
+    #   periodic scanning exceeds this number of records per second.
+    # \param load_weights
+    #   Dictionary of the relative cost of processing each record type for
+    #   the load estimate, by default 1 for all types.
+    # \param data_staging
+    #   If set, a list of the methods tried in turn for staging data files
+    #   into the IOC, see \ref iocinit.IocDataSet.SetDataStaging.  The data
+    #   directory of an existing IOC is then kept, so that unchanged files
+    #   need not be written again.  By default every file is copied.
     def __init__(self, path, ioc_name,
             check_release = True, substitute_boot = False, edm_screen = False,
-            keep_files = [], makefile_name = 'Makefile', build_debug = False):
+            keep_files = [], makefile_name = 'Makefile', build_debug = False,
+            balance_phases = False, link_report = False,
+            memory_report = False, memory_budget = None,
+            prune_records = False, prune_allow = [],
+            load_report = False, load_budget = None, load_weights = {},
+            data_staging = None):
         # Remember parameters
         IocWriter.__init__(self, path)  # Sets up iocRoot
         self.check_release = check_release
@@ -657,6 +741,17 @@ EPICS_BASE = %(EPICS_BASE)s
         self.keep_files = keep_files
         self.edm_screen = edm_screen
         self.build_debug = build_debug
+        self.balance_phases = balance_phases
+        self.prune_records = prune_records
+        self.prune_allow = prune_allow
+        self.load_report = load_report
+        self.load_budget = load_budget
+        self.load_weights = load_weights
+        self.link_report = link_report
+        self.memory_report = memory_report
+        self.memory_budget = memory_budget
+        self.data_staging = data_staging
+        iocinit.IocDataSet.SetDataStaging(data_staging)
 
         # We have to fudge the win32 build as although we run the builder on
         # Linux the IOC will have to be build on Windows.  This is a sign that
@@ -759,6 +854,15 @@ EPICS_BASE = %(EPICS_BASE)s
         if paths.msiPath:
             makefile.AddLine('PATH := $(PATH):%s' % paths.msiPath)
 
+        if self.prune_records:
+            self.PruneRecords(self.prune_allow)
+        if self.balance_phases:
+            self.BalancePhases()
+        # Check the memory budget before anything is written, so that an IOC
+        # over budget isn't left looking complete.
+        if self.memory_report or self.memory_budget is not None:
+            self.CheckMemory()
+
         # Generate the .db and substitutions files and compute the
         # appropriate makefile targets.
         if self.CountSubstitutions():
@@ -768,8 +872,13 @@ EPICS_BASE = %(EPICS_BASE)s
             makefile.AddLine('DB += %s' % expanded)
         if self.CountRecords():
             self.WriteFile((self.iocDbDir, db), self.PrintRecords)
+            if self.link_report:
+                self.WriteLinkReport(
+                    (self.iocDbDir, self.ioc_name + '_links.txt'))
             self.AddDatabase(os.path.join('db', db))
             makefile.AddLine('DB += %s' % db)
+        if self.load_report or self.load_budget is not None:
+            self.CheckScanLoad()
         for func in _DbMakefileHooks:
             db_filename = ''
             if self.CountRecords():
@@ -779,6 +888,33 @@ EPICS_BASE = %(EPICS_BASE)s
                 expanded_filename = expanded
             func(makefile, self.ioc_name, db_filename, expanded_filename)
 
+    # Estimates the database memory, writing the report and checking it
+    # against the budget as requested.
+    def CheckMemory(self):
+        estimate = dbmemory.EstimateMemory()
+        if self.memory_report:
+            self.WriteFile(
+                (self.iocDbDir, self.ioc_name + '_memory.txt'),
+                estimate.PrintReport)
+        if self.memory_budget is not None and \
+                estimate.Total() > self.memory_budget:
+            raise RuntimeError(
+                'Estimated database memory of %d bytes exceeds budget of '
+                '%d bytes' % (estimate.Total(), self.memory_budget))
+
+    # Estimates the load of periodic scanning, writing the report and
+    # checking it against the budget as requested.
+    def CheckScanLoad(self):
+        estimate = scanload.EstimateScanLoad(self.load_weights)
+        if self.load_report:
+            self.WriteFile(
+                (self.iocDbDir, self.ioc_name + '_load.txt'),
+                estimate.PrintReport)
+        if self.load_budget is not None and \
+                estimate.Total() > self.load_budget:
+            print('***Warning: Estimated scan load of %.1f records/second '
+                'exceeds budget of %.1f' % (estimate.Total(), self.load_budget))
+
     def CreateSourceFiles(self):
         makefile = self.makefile_src
         ioc = self.ioc_name
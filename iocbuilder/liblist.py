@@ -53,13 +53,19 @@ class Hardware(Singleton):
     # vxWorks startup script.  First all of the libraries required by each
     # hardware resource are loaded, and then each hardware device is
     # initialised as appropriate.
-    def PrintBody(self):
+    #
+    # If mark is given it is called with a description of each library load
+    # and device initialisation before its code is written, to mark the
+    # start of each section in boot timing mode.
+    def PrintBody(self, mark=None):
         # Now load all the dependent libraries
         print()
         print('# Loading libraries')
         print('# -----------------')
         for l in self.__LibraryList:
             # Generate the code to load the library.
+            if mark and l._HasLibraries():
+                mark('load %s' % l.__name__)
             l._LoadLibraries()
 
         # Now write the individual device initialisations.
@@ -75,6 +81,10 @@ class Hardware(Singleton):
 
         for phase in sorted(device_phases.keys()):
             for device in device_phases[phase]:
+                if mark and device._HasInitialise(phase):
+                    mark('initialise %s phase %s' % (
+                        getattr(device, 'name', device.__class__.__name__),
+                        phase))
                 device._CallInitialise(phase)
 
 
@@ -7,12 +7,12 @@ import string
 import re
 import types
 
-from iocbuilder import hardware, paths, support
+from iocbuilder import cache, hardware, paths, support
 
 
 __all__ = [
     'ModuleVersion', 'ModuleBase', 'modules', 'autodepends',
-    'SetSimulation', 'DummySimulation']
+    'SetSimulation', 'DummySimulation', 'LoadModule']
 
 
 
@@ -31,6 +31,25 @@ def _CheckPythonModule(path, module):
         return (None, False)
 
 
+# Returns the list of Python files defining the module at ModuleFile, which for
+# a package is every Python file in the package directory.
+def _DefinitionFiles(ModuleFile, IsPackage):
+    if IsPackage:
+        path = os.path.dirname(ModuleFile)
+        return sorted(
+            os.path.join(path, filename)
+            for filename in os.listdir(path)
+            if filename.endswith('.py'))
+    else:
+        return [ModuleFile]
+
+# Returns the stamp of the exports index entry for the module at ModuleFile,
+# which changes when any file of the module is modified, added or removed.
+def _ExportsStamp(ModuleFile, IsPackage):
+    filenames = _DefinitionFiles(ModuleFile, IsPackage)
+    return tuple(zip(filenames, cache.FileStamp(*filenames)))
+
+
 _ValidNameChars = re.compile(
     '[^' +
     string.ascii_uppercase + string.ascii_lowercase +
@@ -90,6 +109,12 @@ ReportMissingModuleFiles = True
 #     If set then all ModuleBase subclasses marked as AutoInstantiate
 #     will be instantiated as soon as this module's definitions have
 #     been loaded.
+# \param lazy
+#     If set the builder definitions are only loaded when an attribute of
+#     the module is first read, when one of its hardware exports is used,
+#     or when Load() is called.  This only takes effect if the \c __all__
+#     list of the builder definitions is known from a previous run, see
+#     \ref cache; otherwise the definitions are loaded immediately.
 class ModuleVersion:
     # Set of module macro names already allocated, used to ensure no clashes.
     __MacroNames = set()
@@ -106,7 +131,7 @@ class ModuleVersion:
     def __init__(self, libname,
             version=None, home=None, use_name=True,
             suppress_import=False, load_path=None, override=False,
-            auto_instantiate=False):
+            auto_instantiate=False, lazy=False):
         if Debug:
             print('ModuleVersion(%s, version=%s, home=%s, ...) =>' % \
                 tuple(map(repr, [libname, version, home])), end=' ')
@@ -147,14 +172,35 @@ class ModuleVersion:
         # this module.
         _ModuleVersionTable[libname] = self
         self.__CreateVersionModule()
+        # Set to the builder definitions still to be loaded by Load() and
+        # the names they export while loading is deferred.
+        self.__Pending = None
+        self.__LoadHooks = []
+        self.__DefinitionFiles = []
+        self.__Placeholders = {}
         if suppress_import:
             print('Import of %s skipped' % self.__name, file=sys.stderr)
         else:
-            ModuleVersion._AutoInstances = []
-            self.__LoadModuleDefinitions(load_path)
-            if auto_instantiate:
-                for subclass in ModuleVersion._AutoInstances:
-                    subclass._AutoInstantiate()
+            ModuleFile, IsPackage = self.__FindModuleDefinitions(load_path)
+            if ModuleFile:
+                self.__AddDefinitionFiles(ModuleFile, IsPackage)
+            exports = None
+            if lazy and not auto_instantiate and ModuleFile:
+                exports = _ExportsIndex.Lookup(
+                    os.path.abspath(ModuleFile),
+                    _ExportsStamp(ModuleFile, IsPackage))
+            if exports is not None:
+                self.__DeferDefinitions(ModuleFile, IsPackage, exports)
+            else:
+                ModuleVersion._AutoInstances = []
+                if ModuleFile:
+                    self.__LoadDefinitions(ModuleFile, IsPackage)
+                elif ReportMissingModuleFiles:
+                    print('Module definitions for', self.__name, 'not found',
+                        file=sys.stderr)
+                if auto_instantiate:
+                    for subclass in ModuleVersion._AutoInstances:
+                        subclass._AutoInstantiate()
 
 
     ## Returns the path to the module directory defined by this entry.
@@ -184,6 +230,15 @@ class ModuleVersion:
         assert os.access(filename, os.R_OK), 'File "%s" not found' % filename
         return filename
 
+    ## Returns the list of Python files providing the builder definitions
+    # for this module.  For a package this is every file in the package.
+    def DefinitionFiles(self):
+        return list(self.__DefinitionFiles)
+
+    def __AddDefinitionFiles(self, ModuleFile, IsPackage):
+        self.__DefinitionFiles.extend(
+            _DefinitionFiles(ModuleFile, IsPackage))
+
     ## Returns the EPICS name of this module.
     def Name(self):
         return self.__name
@@ -220,9 +275,30 @@ class ModuleVersion:
         self.module.ModuleVersion = self
         for attr in ['LibPath', 'ModuleFile', 'LoadDefinitions']:
             setattr(self.module, attr, getattr(self, attr))
-
-
-    def __LoadModuleDefinitions(self, load_path):
+        # Any attribute not found in the module is looked up here.
+        self.module.__getattr__ = self.__ModuleAttribute
+
+
+    # Called for attributes missing from the module: if loading of the
+    # definitions has been deferred this is the time to do it.  Most special
+    # names are probed speculatively by Python, so only those which the
+    # import machinery needs from a loaded module trigger loading.
+    def __ModuleAttribute(self, name):
+        if self.__Pending and (
+                not name.startswith('__') or name in ['__all__', '__path__']):
+            self.Load()
+            if name in self.module.__dict__:
+                return self.module.__dict__[name]
+        if name in self.__Placeholders:
+            _ClassesChanged()
+            return self.__Placeholders.pop(name).Create()
+        raise AttributeError('module %s has no attribute %s' % (
+            self.module.__name__, name))
+
+
+    # Searches for the builder definitions for this module, returns the file
+    # to execute and whether it is a package, or None if none are found.
+    def __FindModuleDefinitions(self, load_path):
         if load_path:
             ModuleFile, IsPackage = _CheckPythonModule(load_path, self.__name)
         else:
@@ -237,11 +313,82 @@ class ModuleVersion:
                 ModuleFile, IsPackage = _CheckPythonModule(path, module)
                 if ModuleFile:
                     break
+        return ModuleFile, IsPackage
+
+
+    # Defers loading of the builder definitions until they are needed.  The
+    # names they will export to the hardware module are registered now so
+    # that using any of them triggers the load.
+    def __DeferDefinitions(self, ModuleFile, IsPackage, exports):
+        for name in exports:
+            self.__CheckHardwareName(name)
+        for name in exports:
+            _LazyExports[name] = self
+        self.__Pending = (ModuleFile, IsPackage, exports)
+        if Debug:
+            print('Deferred loading of %s' % self.__name)
+
+
+    def __CheckHardwareName(self, name):
+        assert name not in hardware.__dict__ and \
+                _LazyExports.get(name, self) is self, \
+            'Value %s.%s already in hardware module' % (self.__name, name)
+
+
+    ## Loads the builder definitions for this module if this has been
+    # deferred, see the \c lazy argument to the constructor.  Returns
+    # immediately if the definitions have already been loaded.
+    def Load(self):
+        if self.__Pending:
+            ModuleFile, IsPackage, exports = self.__Pending
+            self.__Pending = None
+            for name in exports:
+                del _LazyExports[name]
+            if Debug:
+                print('Loading deferred definitions for %s' % self.__name)
+            # We may be called in the middle of loading another module, in
+            # which case its loading state must be set aside until we're done.
+            LoadingModule = ModuleVersion._LoadingModule
+            AutoInstances = ModuleVersion._AutoInstances
+            ModuleVersion._LoadingModule = []
+            ModuleVersion._AutoInstances = []
+            try:
+                self.__LoadDefinitions(ModuleFile, IsPackage)
+                hooks, self.__LoadHooks = self.__LoadHooks, []
+                for hook in hooks:
+                    hook()
+            finally:
+                ModuleVersion._LoadingModule = LoadingModule
+                ModuleVersion._AutoInstances = AutoInstances
+                _ClassesChanged()
+
+    ## Returns False if loading of the definitions has been deferred and has
+    # not happened yet.
+    def IsLoaded(self):
+        return self.__Pending is None
+
+    ## Arranges for hook() to be called once the builder definitions of
+    # this module have been loaded: immediately unless loading has been
+    # deferred.
+    def AddLoadHook(self, hook):
+        if self.__Pending:
+            self.__LoadHooks.append(hook)
+        else:
+            hook()
 
-        if ModuleFile:
-            self.__LoadDefinitions(ModuleFile, IsPackage)
-        elif ReportMissingModuleFiles:
-            print('Module definitions for', self.__name, 'not found', file=sys.stderr)
+
+    ## Registers placeholder to stand in for the attribute name of this
+    # module, which is only created when it is first looked up.  At this
+    # point placeholder.Create() is called, which must add the attribute to
+    # the module and return it.
+    def AddPlaceholder(self, name, placeholder):
+        self.__Placeholders[name] = placeholder
+        _ClassesChanged()
+
+    ## Returns the placeholders for attributes of this module which have not
+    # yet been created.
+    def Placeholders(self):
+        return list(self.__Placeholders.values())
 
 
     def __LoadDefinitions(self, ModuleFile, IsPackage):
@@ -260,21 +407,26 @@ class ModuleVersion:
         assert ModuleVersion._LoadingModule.pop() == self, \
             'Something went wrong during module loading!'
 
-        if hasattr(self.module, '__all__'):
-            for name in self.module.__all__:
-                assert not hasattr(hardware, name), \
-                    'Value %s.%s already in hardware module' % (
-                        self.__name, name)
-                setattr(hardware, name, getattr(self.module, name))
+        exports = list(self.module.__dict__.get('__all__', []))
+        for name in exports:
+            self.__CheckHardwareName(name)
+            setattr(hardware, name, getattr(self.module, name))
+        # Remember what was exported so that next time loading of this
+        # module can be deferred.
+        _ExportsIndex.Store(
+            os.path.abspath(ModuleFile),
+            _ExportsStamp(ModuleFile, IsPackage), exports)
 
 
     ## This function can be called to add new definitions to the associated
     # module.
     def LoadDefinitions(self, load_path):
+        self.Load()
         ModuleFile, IsPackage = _CheckPythonModule(load_path, self.__name)
         assert ModuleFile, \
             'Definitions for module %s not found in directory %s' % \
                 (self.__name, load_path)
+        self.__AddDefinitionFiles(ModuleFile, IsPackage)
         self.__LoadDefinitions(ModuleFile, IsPackage)
 
 
@@ -510,6 +662,58 @@ def autodepends(*devices):
 # interrogated when modules are initialised.
 _ModuleVersionTable = {}
 
+## Ensures the builder definitions of the named module are loaded.  Returns
+# False if no module of this name has been declared.
+def LoadModule(name):
+    try:
+        moduleVersion = _ModuleVersionTable[name]
+    except KeyError:
+        return False
+    else:
+        moduleVersion.Load()
+        return True
+
+
+## This is incremented whenever the set of classes available from modules
+# changes other than by a new class being appended to
+# ModuleBase.ModuleBaseClasses, for example when a class is replaced for
+# simulation or a placeholder is added.  This lets lists of classes be cached
+# and updated incrementally.
+ClassGeneration = 0
+
+def _ClassesChanged():
+    global ClassGeneration
+    ClassGeneration += 1
+
+
+## Returns the placeholders for attributes not yet created in all modules,
+# see ModuleVersion.AddPlaceholder().
+def Placeholders():
+    return [placeholder
+        for moduleVersion in sorted(_ModuleVersionTable.values())
+        for placeholder in moduleVersion.Placeholders()]
+
+
+# Index of the names exported through __all__ by each builder definitions
+# file, used to populate the hardware module without loading the file.
+_ExportsIndex = cache.PersistentCache('exports')
+
+# Dictionary of hardware exports of modules whose loading has been deferred,
+# mapping each exported name to its ModuleVersion.  Looking any of these up
+# in the hardware module triggers loading.
+_LazyExports = {}
+
+def _HardwareAttribute(name):
+    try:
+        moduleVersion = _LazyExports[name]
+    except KeyError:
+        raise AttributeError(
+            'module iocbuilder.hardware has no attribute %s' % name)
+    moduleVersion.Load()
+    return getattr(hardware, name)
+
+hardware.__getattr__ = _HardwareAttribute
+
 ## The module iocbuilder.modules contains every EPICS module that has been
 # loaded.
 #
@@ -553,6 +757,7 @@ def SetSimulation(real, sim):
         # first replace it in the list of subclasses
         index = ModuleBase.ModuleBaseClasses.index(real)
         ModuleBase.ModuleBaseClasses[index] = new_sim
+        _ClassesChanged()
         # now in iocbuilder.modules
         for attr in [
                 '__name__', 'ModuleName', 'ArgInfo', 'Defaults', 'Arguments',
@@ -566,4 +771,5 @@ def SetSimulation(real, sim):
         # Remove it from the list of subclasses
         if sim in ModuleBase.ModuleBaseClasses:
             ModuleBase.ModuleBaseClasses.remove(sim)
+            _ClassesChanged()
         return real
@@ -0,0 +1,326 @@
+'''Index of the links between published records, with analysis of lock sets
+and processing chains.'''
+
+from iocbuilder import recordset
+from iocbuilder.recordbase import Record, _Link
+
+
+__all__ = ['LinkGraph']
+
+
+# Specifiers which make a link a channel access link.
+_CaSpecifiers = set(['CA', 'CP', 'CPP'])
+# Specifiers which make a link maximise severity.
+_MsSpecifiers = set(['MS', 'MSS', 'MSI'])
+
+
+# Returns (record name, field, specifiers) for the record named by a link
+# field value, or None if the value is a constant, a hardware address or an
+# unexpanded macro rather than a link to a record.
+def _ParseLink(value):
+    if isinstance(value, _Link):
+        return value.record.name, value.field, tuple(value.specifiers)
+    words = str(value).split()
+    if not words or words[0][0] in '@#' or '$' in words[0]:
+        return None
+    try:
+        float(words[0])
+        return None
+    except ValueError:
+        pass
+    name, _, field = words[0].partition('.')
+    return name, field or None, tuple(words[1:])
+
+
+## A single link from a field of a published record to another record.
+class RecordLink:
+    def __init__(self, source, field, target, target_field, kind, specifiers,
+            local):
+        ## Name of the record containing the link
+        self.source = source
+        ## Link field, for example \c INP or \c FLNK
+        self.field = field
+        ## Name of the linked record
+        self.target = target
+        ## Field of the linked record, or None
+        self.target_field = target_field
+        ## Type of the link field: \c INLINK, \c OUTLINK or \c FWDLINK
+        self.kind = kind
+        ## Link specifiers, such as \c PP or \c CP
+        self.specifiers = specifiers
+        ## True if the target is a record published by this IOC
+        self.local = local
+
+    def __repr__(self):
+        return '<link %s.%s -> %s>' % (self.source, self.field, self.target)
+
+    ## True if this link is resolved through channel access rather than as
+    # a database link within the IOC.
+    def IsCA(self):
+        return not self.local or \
+            bool(_CaSpecifiers.intersection(self.specifiers))
+
+    ## True if processing the source record processes the target through
+    # this link: forward links and process passive links.
+    def Processes(self):
+        return not self.IsCA() and \
+            (self.kind == 'FWDLINK' or 'PP' in self.specifiers)
+
+    ## True if updates of the target process the source through this link.
+    def Monitors(self):
+        return self.kind == 'INLINK' and \
+            bool(set(['CP', 'CPP']).intersection(self.specifiers))
+
+    ## True if this link puts the source and target into the same lock set.
+    # Input links which neither process nor maximise severity don't.
+    def Locks(self):
+        if self.IsCA() or self.source == self.target:
+            return False
+        elif self.kind == 'INLINK':
+            return 'PP' in self.specifiers or \
+                bool(_MsSpecifiers.intersection(self.specifiers))
+        else:
+            return True
+
+
+## Graph of the links between records.
+#
+# The graph is built from the published records when it is created, so it
+# should be created once all records have been generated.  Links to imported
+# records and other records not published by this IOC are included with
+# \c local set to False.
+class LinkGraph:
+    ## Builds the link graph for the given list of records, by default all
+    # published records.
+    def __init__(self, records = None):
+        if records is None:
+            records = recordset.Records()
+        records = [record for record in records if isinstance(record, Record)]
+        self.__records = dict((record.name, record) for record in records)
+        # Links from and to each record name.
+        self.__forward = dict((record.name, []) for record in records)
+        self.__reverse = {}
+
+        for record in records:
+            link_fields = record.LinkFields()
+            for field, value in sorted(record.Fields().items()):
+                kind = link_fields.get(field)
+                parsed = kind and _ParseLink(value)
+                if parsed:
+                    target, target_field, specifiers = parsed
+                    link = RecordLink(
+                        record.name, field, target, target_field, kind,
+                        specifiers, target in self.__records)
+                    self.__forward[record.name].append(link)
+                    self.__reverse.setdefault(target, []).append(link)
+
+    ## Returns the sorted names of the published records in the graph.
+    def Records(self):
+        return sorted(self.__records)
+
+    ## Returns the list of links from fields of the named record.
+    def Links(self, name):
+        return self.__forward.get(name, [])
+
+    ## Returns the list of links to the named record, which need not be
+    # published by this IOC.
+    def ReverseLinks(self, name):
+        return self.__reverse.get(name, [])
+
+    ## Returns the sorted names of all linked records not published by this
+    # IOC.
+    def ExternalTargets(self):
+        return sorted(
+            name for name in self.__reverse if name not in self.__records)
+
+    ## Returns the lock sets of the published records as a list of sorted
+    # lists of record names, largest first.
+    def LockSets(self):
+        parent = dict((name, name) for name in self.__records)
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for links in self.__forward.values():
+            for link in links:
+                if link.Locks():
+                    a, b = find(link.source), find(link.target)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+        locksets = {}
+        for name in sorted(self.__records):
+            locksets.setdefault(find(name), []).append(name)
+        return sorted(locksets.values(), key = lambda l: (-len(l), l[0]))
+
+    ## Returns the sorted names of the records processed, directly or
+    # indirectly, when the named record processes: through forward and
+    # process passive links and, unless \c monitors is False, through CP
+    # links to records it updates.
+    def Processes(self, name, monitors = True):
+        seen = set([name])
+        stack = [name]
+        while stack:
+            for next in self.__Next(stack.pop(), monitors):
+                if next not in seen:
+                    seen.add(next)
+                    stack.append(next)
+        seen.discard(name)
+        return sorted(seen)
+
+    def __Next(self, name, monitors):
+        next = self.__Chained(name)
+        if monitors:
+            next += [link.source for link in self.ReverseLinks(name)
+                if link.Monitors()]
+        return next
+
+    # Returns the records directly processed by the named record through
+    # forward and process passive links.
+    def __Chained(self, name):
+        return [link.target for link in self.Links(name) if link.Processes()]
+
+    ## Returns up to \c count of the longest chains of records processed
+    # through forward and process passive links, each as a list of record
+    # names starting with the record that starts the chain.  Links that
+    # close a cycle are ignored.
+    def LongestChains(self, count = 5):
+        # Length of the longest chain from each record, and the next record
+        # in that chain.  Computed by a depth first search without recursion
+        # as chains can be very long.
+        length = {}
+        follow = {}
+        for start in sorted(self.__records):
+            if start in length:
+                continue
+            active = set([start])
+            stack = [(start, iter(self.__Chained(start)))]
+            while stack:
+                name, children = stack[-1]
+                for child in children:
+                    if child not in length and child not in active:
+                        active.add(child)
+                        stack.append((child, iter(self.__Chained(child))))
+                        break
+                else:
+                    stack.pop()
+                    active.discard(name)
+                    best = None
+                    for child in self.__Chained(name):
+                        if child in length and (best is None or
+                                length[child] > length[best]):
+                            best = child
+                    length[name] = 1 + (best and length[best] or 0)
+                    follow[name] = best
+
+        chains = []
+        seen = set()
+        for name in sorted(length, key = lambda name: (-length[name], name)):
+            if len(chains) >= count or length[name] < 2:
+                break
+            if name not in seen:
+                chain = [name]
+                while follow[chain[-1]] is not None:
+                    chain.append(follow[chain[-1]])
+                seen.update(chain)
+                chains.append(chain)
+        return chains
+
+    ## Returns a list of (target, sources) pairs for every record, local or
+    # not, monitored through CP links, most monitored first.  Each sources
+    # list is the sorted names of the records with CP links to the target.
+    def CpFanIn(self):
+        fanin = []
+        for target, links in self.__reverse.items():
+            sources = sorted(set(
+                link.source for link in links if link.Monitors()))
+            if sources:
+                fanin.append((target, sources))
+        return sorted(fanin, key = lambda entry: (-len(entry[1]), entry[0]))
+
+    ## Returns the cycles of records processing each other through forward
+    # and process passive links, as a list of sorted lists of record names.
+    # Each cycle is a strongly connected set of records, so may contain
+    # several interlinked loops.
+    def Cycles(self):
+        # Tarjan's algorithm, without recursion.
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        cycles = []
+        for start in sorted(self.__records):
+            if start in index:
+                continue
+            work = [(start, iter(self.__Chained(start)))]
+            index[start] = lowlink[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            while work:
+                name, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.__Chained(child))))
+                        break
+                    elif child in on_stack:
+                        lowlink[name] = min(lowlink[name], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[name])
+                    if lowlink[name] == index[name]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == name:
+                                break
+                        if len(component) > 1 or \
+                                name in self.__Chained(name):
+                            cycles.append(sorted(component))
+        return sorted(cycles)
+
+    ## Returns a list of lines summarising the link graph: lock sets, the
+    # longest processing chains, the most monitored records and any
+    # processing cycles.
+    def Report(self, count = 10):
+        links = sum(len(l) for l in self.__forward.values())
+        locksets = self.LockSets()
+        lines = [
+            'Records: %d' % len(self.__records),
+            'Links: %d, to %d records not in this IOC' % (
+                links, len(self.ExternalTargets())),
+            'Lock sets: %d' % len(locksets)]
+        for lockset in locksets[:count]:
+            if len(lockset) > 1:
+                lines.append('    %d records: %s' % (
+                    len(lockset), ', '.join(lockset[:5]) +
+                    (len(lockset) > 5 and ', ...' or '')))
+
+        lines.append('Longest processing chains:')
+        for chain in self.LongestChains(count):
+            lines.append('    %d records: %s' % (
+                len(chain), ' -> '.join(chain)))
+
+        lines.append('CP fan-in:')
+        for target, sources in self.CpFanIn()[:count]:
+            lines.append('    %s: %d records' % (target, len(sources)))
+
+        cycles = self.Cycles()
+        lines.append('Processing cycles: %d' % len(cycles))
+        for cycle in cycles:
+            lines.append('    %s' % ', '.join(cycle))
+        return lines
+
+    ## Prints the report of the link graph to stdout.
+    def PrintReport(self):
+        for line in self.Report():
+            print(line)
@@ -38,7 +38,8 @@ def _populateRecordConstants(dct):
     # In order to make it generic, the following convenient lists of
     # types are exported:
     # FIELD_INT_TYPES, FIELD_CHOICE_TYPES, FIELD_REAL_TYPES and
-    # FIELD_STRING_TYPES
+    # FIELD_STRING_TYPES, and FIELD_LINK_TYPES maps the link field types to
+    # the names INLINK, OUTLINK and FWDLINK.
     if dct:
         (DCT_STRING, DCT_INTEGER, DCT_REAL, DCT_MENU, DCT_MENUFORM, DCT_INLINK,
          DCT_OUTLINK, DCT_FWDLINK, DCT_NOACCESS) = range(9)
@@ -46,6 +47,9 @@ def _populateRecordConstants(dct):
         FIELD_CHOICE_TYPES = [DCT_MENU, DCT_MENUFORM]
         FIELD_REAL_TYPES = [DCT_REAL]
         FIELD_STRING_TYPES = [DCT_STRING, DCT_INLINK, DCT_OUTLINK, DCT_FWDLINK]
+        FIELD_LINK_TYPES = {
+            DCT_INLINK: 'INLINK', DCT_OUTLINK: 'OUTLINK',
+            DCT_FWDLINK: 'FWDLINK'}
     else:
         (DBF_STRING, DBF_CHAR, DBF_UCHAR, DBF_SHORT, DBF_USHORT, DBF_LONG,
          DBF_ULONG, DBF_INT64, DBF_UINT64, DBF_FLOAT, DBF_DOUBLE, DBF_ENUM,
@@ -57,6 +61,9 @@ def _populateRecordConstants(dct):
         FIELD_CHOICE_TYPES = [DBF_MENU, DBF_DEVICE]
         FIELD_REAL_TYPES = [DBF_FLOAT, DBF_DOUBLE]
         FIELD_STRING_TYPES = [DBF_STRING, DBF_INLINK, DBF_OUTLINK, DBF_FWDLINK]
+        FIELD_LINK_TYPES = {
+            DBF_INLINK: 'INLINK', DBF_OUTLINK: 'OUTLINK',
+            DBF_FWDLINK: 'FWDLINK'}
 
     for key, val in locals().items():
         if key.startswith('FIELD_'):
@@ -22,6 +22,12 @@
 #   msiPath
 #       This is used to compute the location of the msi executable.  This is
 #       optional if msi is on the path.
+#
+#   cache_path
+#       Directory where information derived from support modules is cached
+#       between runs.  Defaults to ~/.cache/iocbuilder, can be overridden by
+#       setting IOCBUILDER_CACHE in the environment; if set to an empty
+#       string nothing is cached on disk.
 
 import os
 
@@ -84,6 +90,10 @@ module_path = None
 module_work_path = None
 msiPath = None
 
+# Persistent cache directory, None if caching to disk is disabled.
+cache_path = os.environ.get('IOCBUILDER_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'iocbuilder')) or None
+
 # If EPICS_BASE has been set in the environment set this version by default.
 # This can be overridden subsequently by another call to SetEpicsBase.
 if 'EPICS_BASE' in os.environ:
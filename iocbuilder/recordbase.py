@@ -125,6 +125,7 @@ class Record(object):
         # bypass the tricksy use of __setattr__.
         self.__setattr('__fields', {})
         self.__setattr('__aliases', set())
+        self.__setattr('__exported', False)
         self.__setattr('name', self.RecordName(record))
 
         # Support the special 'address' field as an alias for either INP or
@@ -146,6 +147,20 @@ class Record(object):
     def add_alias(self, alias):
         self.__aliases.add(alias)
 
+    ## Marks this record as being used by channel access clients, so that it
+    # is never pruned as unused.
+    def MarkExported(self):
+        self.__setattr('__exported', True)
+
+    ## Returns True if this record has been marked as used by channel access
+    # clients or has an alias.
+    def IsExported(self):
+        return self.__exported or bool(self.__aliases)
+
+    ## Returns a dictionary of the fields currently assigned to this record.
+    def Fields(self):
+        return dict(self.__fields)
+
 
     # Call to generate database description of this record.  Outputs record
     # definition in .db file format.  Hooks for meta-data can go here.
@@ -248,6 +263,12 @@ class Record(object):
     def FieldInfo(cls):
         return cls._validate.FieldInfo()
 
+    ## Returns a dictionary mapping the name of each link field of this record
+    # type to its link type: one of \c INLINK, \c OUTLINK or \c FWDLINK.
+    @classmethod
+    def LinkFields(cls):
+        return cls._validate.LinkFields()
+
     # When a record is pickled for export it will reappear as an ImportRecord
     # instance.  This makes more sense (as the record has been fully generated
     # already), and avoids a lot of trouble.
@@ -0,0 +1,81 @@
+'''Detection and removal of published records which nothing uses.'''
+
+import fnmatch
+
+from iocbuilder import recordset
+from iocbuilder.linkgraph import LinkGraph
+from iocbuilder.recordbase import Record
+
+
+__all__ = ['DeadRecords', 'PruneRecords']
+
+
+## Types of record which only exist to be processed by other records, and so
+# have no purpose if nothing processes them.
+PrunableTypes = set([
+    'calc', 'calcout', 'scalcout', 'acalcout', 'fanout', 'dfanout',
+    'seq', 'sseq', 'sub', 'aSub'])
+
+
+# Returns True if the record is processed on its own account, by being
+# scanned or processed at initialisation.
+def _Processed(fields):
+    scan = str(fields.get('SCAN', 'Passive'))
+    pini = str(fields.get('PINI', 'NO'))
+    return scan not in ('Passive', '0') or pini not in ('NO', '0')
+
+
+## Returns the sorted names of the published records which nothing uses.
+# These are records of one of the \ref PrunableTypes which are passive, not
+# processed at initialisation, not processed on updates through their own CP
+# or CPP input links, not marked as exported and not linked to by any record
+# in use, including the records of expanded substitutions.
+#
+# \param allow
+#   List of fnmatch patterns for the names of records meant for channel
+#   access clients, which are never reported.
+def DeadRecords(allow = []):
+    records = [record
+        for record in recordset.Records()
+        if isinstance(record, Record)]
+    published = set(record.name for record in records)
+    graph = LinkGraph(records)
+
+    # Records of expanded substitutions can link to published records by name.
+    templated = set()
+    for record_type, name, fields in recordset.ExpandedRecords():
+        if name not in published:
+            for value in fields.values():
+                words = value.split()
+                if words:
+                    templated.add(words[0].split('.')[0])
+
+    candidates = set(
+        record.name for record in records
+        if record._type in PrunableTypes and
+            not _Processed(record.Fields()) and
+            not any(link.Monitors() for link in graph.Links(record.name)) and
+            not record.IsExported() and
+            record.name not in templated and
+            not any(fnmatch.fnmatchcase(record.name, pattern)
+                for pattern in allow))
+
+    # Anything linked to from a record in use is itself in use.
+    live = [name for name in published if name not in candidates]
+    used = set(live)
+    while live:
+        for link in graph.Links(live.pop()):
+            if link.target in candidates and link.target not in used:
+                used.add(link.target)
+                live.append(link.target)
+    dead = candidates - used
+    return sorted(dead)
+
+
+## Removes the records reported by \ref DeadRecords from the published
+# records and returns their names.
+def PruneRecords(allow = []):
+    dead = DeadRecords(allow)
+    for name in dead:
+        recordset.RemoveRecord(name)
+    return dead
@@ -3,7 +3,7 @@
 import os.path
 import subprocess
 
-from iocbuilder import libversion, paths, recordnames, support
+from iocbuilder import dbparse, libversion, paths, recordnames, support
 
 
 __all__ = ['LookupRecord', 'Substitution']
@@ -23,6 +23,10 @@ class RecordSet(support.Singleton):
         assert name not in self.__RecordSet, 'Record %s already defined' % name
         self.__RecordSet[name] = record
 
+    # Removes a published record, which will no longer be printed.
+    def RemoveRecord(self, name):
+        del self.__RecordSet[name]
+
     # Returns the record with the given name.  We perform record name
     # expansion using the currently configured record name hook.
     def LookupRecord(self, record):
@@ -41,6 +45,11 @@ class RecordSet(support.Singleton):
     def CountRecords(self):
         return len(self.__RecordSet)
 
+    # Returns the list of published records in name order.
+    def Records(self):
+        return [self.__RecordSet[name]
+            for name in sorted(self.__RecordSet.keys())]
+
     def AddHeaderLine(self, line):
         self.__HeaderLines.append(line)
 
@@ -246,6 +255,22 @@ RecordsSubstitutionSet = Substitution.SubstitutionSet
 AllSubstitutions = RecordsSubstitutionSet.AllSubstitutions
 
 
+# Returns (record type, record name, fields) for every record of the IOC: the
+# published records followed by the records of the expanded substitution
+# templates.  Field values are returned as strings.
+def ExpandedRecords():
+    records = [
+        (record._type, record.name, dict(
+            (name, str(value)) for name, value in record.Fields().items()))
+        for record in RecordSet.Records()]
+    for substitution in AllSubstitutions():
+        template = substitution.TemplateName(False)
+        if os.path.isfile(template):
+            records.extend(
+                dbparse.Records(template, macros = substitution.args))
+    return records
+
+
 # Converts a string into a form suitable for passing to the database expansion
 # and substitution framework.
 def QuoteArgument(argument):
@@ -265,6 +290,8 @@ def QuoteArgument(argument):
 # Publicly available methods.
 PublishRecord = RecordSet.PublishRecord
 LookupRecord = RecordSet.LookupRecord
+Records = RecordSet.Records
+RemoveRecord = RecordSet.RemoveRecord
 
 
 # Special recordset reset.
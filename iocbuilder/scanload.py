@@ -0,0 +1,93 @@
+'''Estimates of the processing load of each periodic scan rate.'''
+
+from iocbuilder import recordset
+from iocbuilder.linkgraph import LinkGraph
+from iocbuilder.recordbase import Record
+from iocbuilder.scanphase import ScanPeriod
+
+
+__all__ = ['EstimateScanLoad']
+
+
+## Estimated processing load of the periodic scan rates of an IOC.
+class ScanLoad:
+    def __init__(self):
+        ## Dictionary indexed by scan period in seconds of [scanned records,
+        # records processed in the scan thread, weighted load in the scan
+        # thread, scanned records triggering CP processing, records processed
+        # through CP links, weighted load through CP links], all per scan.
+        self.rates = {}
+
+    def _Add(self, period, chained, chained_load, monitored, monitored_load):
+        entry = self.rates.setdefault(period, [0, 0, 0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += chained
+        entry[2] += chained_load
+        entry[3] += bool(monitored)
+        entry[4] += monitored
+        entry[5] += monitored_load
+
+    ## Returns the weighted load per second of the scan thread of the given
+    # scan period.
+    def ThreadLoad(self, period):
+        return self.rates[period][2] / period
+
+    ## Returns the total weighted load per second of all periodic scanning,
+    # including processing triggered through CP links.
+    def Total(self):
+        return sum(
+            (entry[2] + entry[5]) / period
+            for period, entry in self.rates.items())
+
+    ## Returns a list of lines reporting the load of each scan rate.
+    def Report(self):
+        lines = ['%-10s %8s %10s %10s %8s %10s %10s' % (
+            'Period', 'Scanned', 'Records/s', 'Load/s',
+            'CP', 'CP recs/s', 'CP load/s')]
+        for period in sorted(self.rates):
+            scanned, chained, chained_load, monitoring, monitored, \
+                monitored_load = self.rates[period]
+            lines.append('%-10s %8d %10.1f %10.1f %8d %10.1f %10.1f' % (
+                '%g s' % period, scanned, chained / period,
+                chained_load / period, monitoring, monitored / period,
+                monitored_load / period))
+        lines.append('%-10s %8s %10s %10.1f' % ('Total', '', '', self.Total()))
+        return lines
+
+    ## Prints the report to stdout.
+    def PrintReport(self):
+        for line in self.Report():
+            print(line)
+
+
+## Estimates the records processed per second by each periodic scan rate of
+# the published records.  Each scanned record is counted together with the
+# records it processes through forward and process passive links, which run
+# in the scan thread, and separately the records then processed through CP
+# links.  Returns a ScanLoad.
+#
+# \param weights
+#   Dictionary of the relative cost of processing each record type, by
+#   default 1 for all types.
+def EstimateScanLoad(weights = {}):
+    records = dict(
+        (record.name, record)
+        for record in recordset.Records()
+        if isinstance(record, Record))
+    graph = LinkGraph(list(records.values()))
+
+    def load(names):
+        return sum(
+            weights.get(records[name]._type, 1)
+            for name in names if name in records)
+
+    estimate = ScanLoad()
+    for name in sorted(records):
+        period = ScanPeriod(records[name].Fields().get('SCAN', ''))
+        if period is not None:
+            chained = [name] + graph.Processes(name, False)
+            monitored = set(graph.Processes(name)) - set(chained)
+            estimate._Add(period,
+                len(chained), load(chained),
+                len(monitored), load(monitored))
+    return estimate
@@ -0,0 +1,92 @@
+'''Assignment of scan phases to periodically scanned records.'''
+
+import re
+
+from iocbuilder import recordset
+from iocbuilder.linkgraph import LinkGraph
+from iocbuilder.recordbase import Record
+
+
+__all__ = ['BalancePhases']
+
+
+# Matches the periodic scan rates, for example "1 second" or ".1 second".
+_PeriodicScan = re.compile(r'\s*([0-9]*\.?[0-9]+)\s*second\s*$')
+
+
+# Returns the period in seconds of the given SCAN field value, or None if it
+# is not a periodic scan.
+def ScanPeriod(scan):
+    match = _PeriodicScan.match(str(scan))
+    if match:
+        return float(match.group(1))
+    else:
+        return None
+
+
+# Returns the phase of a record with an explicitly assigned PHAS field.
+def _Phase(value):
+    try:
+        return int(str(value))
+    except ValueError:
+        return 0
+
+
+## Spreads periodically scanned records across scan phases.
+#
+# The records of each periodic scan rate which don't already have a PHAS
+# field are assigned to one of \c phases phases, keeping all records of one
+# lock set in the same phase and filling the least loaded phase first.
+# Records with PHAS already set are left alone but count towards the load of
+# their phase.  Returns a list of lines reporting the resulting load of each
+# scan rate, suitable for adding to the database header.
+#
+# \param phases
+#   Number of scan phases to spread each scan rate over.
+def BalancePhases(phases = 10):
+    assert phases > 0, 'Must have at least one phase'
+
+    records = [record
+        for record in recordset.Records()
+        if isinstance(record, Record)]
+    locksets = {}
+    for lockset in LinkGraph(records).LockSets():
+        for name in lockset:
+            locksets[name] = lockset[0]
+
+    # Group the periodic records by scan rate and, for records without a
+    # phase, by lock set.
+    rates = {}
+    for record in records:
+        fields = record.Fields()
+        period = ScanPeriod(fields.get('SCAN', ''))
+        if period is not None:
+            loads, groups = rates.setdefault(period, ({}, {}))
+            if 'PHAS' in fields:
+                phase = _Phase(fields['PHAS'])
+                loads[phase] = loads.get(phase, 0) + 1
+            else:
+                groups.setdefault(locksets[record.name], []).append(record)
+
+    report = []
+    for period in sorted(rates):
+        loads, groups = rates[period]
+        for phase in range(phases):
+            loads.setdefault(phase, 0)
+
+        # Largest lock sets first, each into the least loaded phase.
+        for lockset in sorted(groups.values(),
+                key = lambda group: (-len(group), group[0].name)):
+            phase = min(range(phases), key = lambda phase: loads[phase])
+            for record in lockset:
+                record.PHAS = phase
+            loads[phase] += len(lockset)
+
+        total = sum(loads.values())
+        report.append(
+            '# SCAN %g second: %d records in %d lock sets, '
+            '%.1f records/second' % (
+                period, total, len(groups), total / period))
+        report.append('#   records per phase: %s' % ', '.join(
+            '%d:%d' % (phase, loads[phase]) for phase in sorted(loads)))
+    return report
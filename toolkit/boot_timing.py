@@ -0,0 +1,108 @@
+#!/bin/env dls-python
+
+from optparse import OptionParser
+import datetime
+import re
+import sys
+
+# The boot timing markers written by an IOC started with boot timing enabled.
+# On vxWorks each marker carries the tick count, on other targets the marker
+# is followed by the output of the date command.
+marker_re = re.compile(r'^@@BOOT (.*?)(?: (\d+))?\s*$')
+rate_re = re.compile(r'^@@BOOT-RATE (\d+)\s*$')
+date_re = re.compile(
+    r'(\d{4})[/-](\d\d)[/-](\d\d)[ T](\d\d):(\d\d):(\d\d)(?:\.(\d+))?')
+
+
+def parse_date(line):
+    '''Returns the time in seconds given by a date line, or None'''
+    match = date_re.search(line)
+    if match:
+        fields = match.groups()
+        when = datetime.datetime(*[int(f) for f in fields[:6]])
+        fraction = float('0.' + (fields[6] or '0'))
+        return (when - datetime.datetime(1970, 1, 1)).total_seconds() + \
+            fraction
+    return None
+
+
+def parse_log(lines):
+    '''Returns a list of (section, time in seconds) for the markers in the
+    boot log'''
+    marks = []
+    rate = None
+    pending = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        match = rate_re.match(line)
+        if match:
+            rate = int(match.group(1))
+            continue
+        match = marker_re.match(line)
+        if match:
+            section, ticks = match.groups()
+            if ticks is not None and rate:
+                marks.append((section, float(ticks) / rate))
+                pending = None
+            else:
+                # the time follows on the next date line
+                pending = line[len('@@BOOT '):].strip()
+            continue
+        if pending is not None:
+            when = parse_date(line)
+            if when is not None:
+                marks.append((pending, when))
+                pending = None
+    return marks
+
+
+def timing_table(marks):
+    '''Returns a list of (section, start, duration) from the markers, with
+    start relative to the first marker.  Each section lasts until the next
+    marker, so the final marker has no duration'''
+    table = []
+    if marks:
+        first = marks[0][1]
+        for (section, start), (_, end) in zip(marks, marks[1:]):
+            table.append((section, start - first, end - start))
+    return table
+
+
+def main():
+    parser = OptionParser('''usage: %prog [options] [<boot-log> ...]
+
+Print the time taken by each section of the startup script of an IOC built
+with boot timing enabled, from its boot log or standard input''')
+    parser.add_option(
+        '-s', action='store_true', dest='sort',
+        help='Sort the sections by the time taken, slowest first')
+    parser.add_option(
+        '-n', dest='count', type='int', default=None,
+        help='Only print the COUNT slowest sections')
+
+    (options, args) = parser.parse_args()
+    lines = []
+    if args:
+        for filename in args:
+            lines.extend(open(filename, errors='replace'))
+    else:
+        lines = sys.stdin.readlines()
+
+    table = timing_table(parse_log(lines))
+    if not table:
+        parser.error('No boot timing markers found')
+    total = sum(duration for _, _, duration in table)
+    if options.sort or options.count is not None:
+        table.sort(key=lambda entry: -entry[2])
+    if options.count is not None:
+        table = table[:options.count]
+
+    print('%10s %10s %6s  %s' % ('Start', 'Time', '%', 'Section'))
+    for section, start, duration in table:
+        print('%10.3f %10.3f %6.1f  %s' % (
+            start, duration, total and 100 * duration / total, section))
+    print('%10s %10.3f %6s  %s' % ('', total, '', 'Total'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,15 @@
 from PyQt5.QtCore import Qt, QVariant
 from PyQt5.QtWidgets import QUndoCommand
 
+def storedValue(value):
+    # the value stored in a cell when it is set to value
+    if str(value.value()) == '':
+        return QVariant()
+    elif str(value.value()) == '""':
+        return QVariant('')
+    else:
+        return value
+
 class ChangeValueCommand(QUndoCommand):
     def __init__(self, row, column, value, model):
         QUndoCommand.__init__(self)
@@ -18,12 +27,12 @@ class ChangeValueCommand(QUndoCommand):
             (row + 1, str(model._header[column].value()), label))
 
     def _do(self, new, old):
-        if str(new.value()) == '':
-            new = QVariant()
-        elif str(new.value()) == '""':
-            new = QVariant('')
+        new = storedValue(new)
 
         self.model.rows[self.row][self.column] = new
+        if self.column in (0, 2):
+            # commented state or object name
+            self.model._parent.names.rowChanged(self.model, self.row)
 
         if self.column == 0:
             # commented or uncommented
@@ -48,32 +57,82 @@ class ChangeValueCommand(QUndoCommand):
         self._do(self.old, self.new)
 
 
+class CellsCommand(QUndoCommand):
+    # set a number of cells as a single undo step, changes is a list of
+    # (row, column, value)
+    def __init__(self, changes, model, text):
+        QUndoCommand.__init__(self)
+        self.model = model
+        self.changes = [(row, column, model.rows[row][column], QVariant(value))
+            for row, column, value in changes]
+        self.setText(text)
+
+    def _do(self, values):
+        names = self.model._parent.names
+        rows = set()
+        for row, column, value in values:
+            self.model.rows[row][column] = storedValue(value)
+            if column in (0, 2):
+                # commented state or object name
+                rows.add(row)
+        for row in sorted(rows):
+            names.rowChanged(self.model, row)
+        if rows:
+            # other objects might reference the names, so the whole table
+            # may need redrawing
+            index1 = self.model.index(0, 0)
+            index2 = self.model.index(
+                self.model.rowCount()-1, self.model.columnCount()-1)
+        else:
+            index1 = self.model.index(
+                min(x[0] for x in values), min(x[1] for x in values))
+            index2 = self.model.index(
+                max(x[0] for x in values), max(x[1] for x in values))
+        self.model.dataChanged.emit(index1, index2)
+
+    def redo(self):
+        self._do([(row, column, new)
+            for row, column, old, new in self.changes])
+
+    def undo(self):
+        self._do([(row, column, old)
+            for row, column, old, new in reversed(self.changes)])
+
+
 class RowCommand(QUndoCommand):
-    def __init__(self, row, model, parent, add = True):
+    def __init__(self, row, model, parent, add = True, count = 1):
         QUndoCommand.__init__(self)
         self.row = row
+        self.count = count
         self.add = add
         self.model = model
         self._parent = parent
+        if count == 1:
+            rowText = 'Row %s' % (row + 1)
+        else:
+            rowText = 'Rows %d..%d' % (row + 1, row + count)
         if add:
-            self.rowdata = [ QVariant() for x in model._header ]
-            self.setText('Inserted Row %s' % (row + 1))
+            self.rowdata = [ [ QVariant() for x in model._header ]
+                for i in range(count) ]
+            self.setText('Inserted ' + rowText)
         else:
-            self.rowdata = [ QVariant(x) for x in model.rows[row] ]
-            self.setText('Removed Row %s' % (row + 1))
+            self.rowdata = [ [ QVariant(x) for x in r ]
+                for r in model.rows[row:row + count] ]
+            self.setText('Removed ' + rowText)
 
     def addRow(self):
-        self.model.beginInsertRows(self._parent, self.row, self.row)
-        self.model.rows = \
-            self.model.rows[:self.row] + [self.rowdata] + \
-            self.model.rows[self.row:]
+        self.model.beginInsertRows(
+            self._parent, self.row, self.row + self.count - 1)
+        self.model.rows[self.row:self.row] = self.rowdata
+        self.model._parent.names.rowInserted(self.model, self.row, self.count)
         self.model.endInsertRows()
         self.emitDataChanged()
 
     def removeRow(self):
-        self.model.beginRemoveRows(self._parent, self.row, self.row)
-        self.model.rows = \
-            self.model.rows[:self.row] + self.model.rows[self.row + 1:]
+        self.model.beginRemoveRows(
+            self._parent, self.row, self.row + self.count - 1)
+        del self.model.rows[self.row:self.row + self.count]
+        self.model._parent.names.rowRemoved(self.model, self.row, self.count)
         self.model.endRemoveRows()
         self.emitDataChanged()
 
@@ -0,0 +1,202 @@
+class NameIndex(object):
+    '''Store-wide index of the object names in the displayed tables, kept up
+    to date as rows are edited, added and removed so that name lookups don't
+    have to rescan every row of every table.'''
+
+    def __init__(self, store):
+        self._store = store
+        # table -> list of the object name in each row, or None if the row
+        # has no name or is commented out
+        self._rows = {}
+        # name -> number of rows with that name in the displayed tables
+        self._counts = None
+        # name -> (table position, row) of its first occurrence
+        self._first = None
+        # table -> position in the display order
+        self._positions = None
+        # (filt, table, upto) -> list of names, valid for this version
+        self._lists = {}
+        # incremented every time any name changes
+        self.version = 0
+        # incremented when rows or tables are added, removed or reordered
+        self._structure = 0
+        # name -> number of times rows have changed to or from that name
+        self._nameVersions = {}
+
+    def _rowName(self, row):
+        # the name of a row as it appears in name lists
+        if row[2].isNull() or row[0].value():
+            return None
+        else:
+            return str(row[2].value())
+
+    def _names(self, table):
+        # the row names of table, added to the index on first use
+        if table not in self._rows:
+            self._rows[table] = [self._rowName(row) for row in table.rows]
+        return self._rows[table]
+
+    def _displayed(self):
+        # the displayed tables in order
+        return [self._store._table(name) for name in self._store.getTableNames()]
+
+    def _changed(self, *names):
+        self._lists = {}
+        self.version += 1
+        if names:
+            for name in names:
+                self._nameVersions[name] = self._nameVersions.get(name, 0) + 1
+        else:
+            self._structure += 1
+
+    def stamp(self, name):
+        # a value that changes whenever the result of a lookup of name might
+        return self._structure, self._nameVersions.get(name, 0)
+
+    def _moved(self, table, row, old, new):
+        # row of table has changed from name old to name new, without moving
+        # any other rows
+        if self._first is None:
+            return
+        position = self._getPositions().get(table)
+        if position is None:
+            return
+        if old is not None and self._first.get(old) == (position, row):
+            # the first occurrence has gone, so look for it again next time
+            self._first = None
+        elif new is not None and (position, row) < \
+                self._first.get(new, (position, row + 1)):
+            self._first[new] = (position, row)
+
+    def _count(self, table, name, delta):
+        # adjust the count for name if table is displayed
+        if name is not None and self._counts is not None and \
+                table in self._getPositions():
+            self._counts[name] = self._counts.get(name, 0) + delta
+
+    def _getPositions(self):
+        if self._positions is None:
+            self._positions = dict(
+                (table, i) for i, table in enumerate(self._displayed()))
+        return self._positions
+
+    def _getCounts(self):
+        if self._counts is None:
+            counts = {}
+            for table in self._displayed():
+                for name in self._names(table):
+                    if name is not None:
+                        counts[name] = counts.get(name, 0) + 1
+            self._counts = counts
+        return self._counts
+
+    def _getFirst(self):
+        if self._first is None:
+            first = {}
+            for position, table in enumerate(self._displayed()):
+                for i, name in enumerate(self._names(table)):
+                    if name is not None and name not in first:
+                        first[name] = (position, i)
+            self._first = first
+        return self._first
+
+    def clear(self):
+        # forget everything, used when the tables are replaced
+        self._rows = {}
+        self.tablesChanged()
+
+    def tablesChanged(self):
+        # the displayed tables or their order have changed
+        self._counts = None
+        self._positions = None
+        self._first = None
+        self._changed()
+
+    def rowChanged(self, table, row):
+        # the name or commented state of a row has changed
+        names = self._names(table)
+        old, new = names[row], self._rowName(table.rows[row])
+        if old != new:
+            names[row] = new
+            self._count(table, old, -1)
+            self._count(table, new, 1)
+            self._moved(table, row, old, new)
+            self._changed(old, new)
+
+    def rowInserted(self, table, row, count = 1):
+        # count rows have been inserted into table at row
+        if table not in self._rows:
+            # this will pick up the new rows when they are needed
+            self._first = None
+            self._changed()
+            return
+        new = [self._rowName(r) for r in table.rows[row:row + count]]
+        names = self._rows[table]
+        names[row:row] = new
+        for i, name in enumerate(new):
+            self._count(table, name, 1)
+            if row + count == len(names):
+                self._moved(table, row + i, None, name)
+        if row + count != len(names):
+            # the rows after them have moved down
+            self._first = None
+        self._changed()
+
+    def rowRemoved(self, table, row, count = 1):
+        # count rows have been removed from table at row
+        self._first = None
+        if table in self._rows:
+            names = self._rows[table]
+            for name in names[row:row + count]:
+                self._count(table, name, -1)
+            del names[row:row + count]
+        self._changed()
+
+    def isUnique(self, table, row, name):
+        # True if no row other than row of table has this name
+        count = self._getCounts().get(name, 0)
+        if table in self._getPositions() and self._names(table)[row] == name:
+            count -= 1
+        return count == 0
+
+    def isDefined(self, table, row, name, filt = None):
+        # True if name is in names(filt, table, row)
+        if self._filtered(filt):
+            return name in self.names(filt, table, row)
+        first = self._getFirst().get(name)
+        if first is None:
+            return False
+        position = self._getPositions().get(table)
+        return position is None or first < (position, row)
+
+    def _excluded(self, table, filt):
+        # if we have a filter, then make sure this table is a subclass of it.
+        # Either can be a catalog stub standing in for the class
+        from iocbuilder.catalog import IsSubclass
+        return filt is not None and not IsSubclass(table.ob, filt)
+
+    def _filtered(self, filt):
+        # True if filt excludes any of the displayed tables
+        return filt is not None and \
+            any(self._excluded(table, filt) for table in self._displayed())
+
+    def names(self, filt = None, table = None, upto = None):
+        # list of names in the displayed tables, in order, of objects
+        # matching filt.  If upto is given then only names before row upto
+        # of table are returned
+        key = (filt, table, upto)
+        if key not in self._lists:
+            sl = []
+            for t in self._displayed():
+                if self._excluded(t, filt):
+                    # if we are only going up to a certain table and this is it
+                    if t == table and upto is not None:
+                        break
+                    continue
+                names = self._names(t)
+                if t == table and upto is not None:
+                    sl.extend(n for n in names[:upto] if n is not None)
+                    break
+                sl.extend(n for n in names if n is not None)
+            self._lists[key] = sl
+        return self._lists[key]
@@ -1,22 +1,28 @@
 #!/bin/env dls-python2.7
 
+import multiprocessing
 import os
+import queue
 import re
 import sys
 import signal
+import time
 import traceback
 
-from PyQt5.QtCore import Qt, QEvent, QPoint, QSize, QVariant
-from PyQt5.QtGui import QClipboard, QFont, QIcon
+from PyQt5.QtCore import (
+    Qt, QEvent, QPoint, QProcess, QSize, QTimer, QVariant)
+from PyQt5.QtGui import QClipboard, QFont, QIcon, QTextCursor
 from PyQt5.QtWidgets import (
     QAbstractItemView, QAction, QApplication, QDialog, QDockWidget,
     QFileDialog, QGridLayout, QInputDialog, QLabel, QLineEdit,
     QListWidget, QListWidgetItem, QMainWindow, QMenu, QMessageBox,
-    QPushButton, QScrollArea, QTableView, QTextEdit, QToolTip,
-    QUndoView)
+    QProgressDialog, QPushButton, QScrollArea, QTableView, QTextEdit,
+    QToolTip, QUndoView)
 from optparse import OptionParser
 
 from xmlbuilder.delegates import ComboBoxDelegate
+from xmlbuilder.xmlconfig import read_architecture
+from xmlbuilder import xmlworker
 
 
 class TooltipMenu(QMenu):
@@ -108,10 +114,7 @@ class TableView(QTableView):
         mincols = min(cols)
         nrows = max(rows) - minrows + 1
         ncols = max(cols) - mincols + 1
-        if inc:
-            self.model().stack.beginMacro('Increment Cells')
-        else:
-            self.model().stack.beginMacro('Fill Cells')
+        changes = []
         if nrows == 1:
             for x in selRange:
                 if x.column() == mincols and x.row() == minrows:
@@ -128,7 +131,7 @@ class TableView(QTableView):
                     text = self.subText(srcText, cell.column() - mincols)
                 else:
                     text = srcText
-                self.__setCell(self.model(), cell.row(), cell.column(), text)
+                changes.append((cell.row(), cell.column(), text))
         else:
             # Treat as a group of columns
             for col in set(cols):
@@ -146,8 +149,11 @@ class TableView(QTableView):
                         text = self.subText(srcText, cell.row() - minrows)
                     else:
                         text = srcText
-                    self.__setCell(self.model(), cell.row(), cell.column(), text)
-        self.model().stack.endMacro()
+                    changes.append((cell.row(), cell.column(), text))
+        if inc:
+            self.__setCells(self.model(), changes, 'Increment Cells')
+        else:
+            self.__setCells(self.model(), changes, 'Fill Cells')
 
     def cut(self):
         self.copy()
@@ -159,14 +165,17 @@ class TableView(QTableView):
             items[0].model().clearIndexes(self.selectedIndexes())
             self.clearSelection()
 
-    def __setCell(self, model, row, col, val):
-        if val != '\x00':
-            if val == 'False':
-                val = False
-            elif val == 'True':
-                val = True
-            index = model.index(row, col)
-            model.setData(index, QVariant(val), Qt.EditRole)
+    def __setCells(self, model, cells, text):
+        # set a list of (row, col, val) cells as a single undo step
+        values = []
+        for row, col, val in cells:
+            if val != '\x00':
+                if val == 'False':
+                    val = False
+                elif val == 'True':
+                    val = True
+                values.append((row, col, QVariant(val)))
+        model.setCells(values, text)
 
     def paste(self):
         cb = app.clipboard()
@@ -192,15 +201,18 @@ class TableView(QTableView):
         for row in data:
             for i, val in enumerate(row):
                 row[i] = val.replace("\\n", "\n").replace("\\t", "\t")
-        selRange[0].model().stack.beginMacro('Paste from clipboard')
+        model = selRange[0].model()
+        changes = []
         if len(selRange) == 1:
             # single cell selected, so write the size of the clipboard
-            model = selRange[0].model()
             for row in range(minrows, minrows + nrows):
                 for col in range(mincols, mincols + ncols):
-                    val = data[row - minrows][col - mincols]
+                    try:
+                        val = data[row - minrows][col - mincols]
+                    except IndexError:
+                        continue
                     if model.index(row, col).data() != val:
-                        self.__setCell(model, row, col, val)
+                        changes.append((row, col, val))
         else:
             # many cells selected
             for cell in selRange:
@@ -210,8 +222,8 @@ class TableView(QTableView):
                     pass
                 else:
                     if cell.data() != val:
-                        self.__setCell(cell.model(), cell.row(), cell.column(), val)
-        selRange[0].model().stack.endMacro()
+                        changes.append((cell.row(), cell.column(), val))
+        self.__setCells(model, changes, 'Paste from clipboard')
 
     def insertRowUnder(self):
         self.insertRow(True)
@@ -236,9 +248,21 @@ class TableView(QTableView):
         selRange = self.selectedIndexes()
         if not selRange:
             return
-        rows = [ x.row() for x in selRange ]
-        for row in reversed(sorted(set(rows))):
-            selRange[0].model().removeRows(row, 1)
+        model = selRange[0].model()
+        # remove each run of consecutive rows in one go, from the bottom up
+        runs = []
+        for row in reversed(sorted(set(x.row() for x in selRange))):
+            if runs and runs[-1][0] == row + 1:
+                runs[-1][0] = row
+                runs[-1][1] += 1
+            else:
+                runs.append([row, 1])
+        if len(runs) > 1:
+            model.stack.beginMacro('Remove rows')
+        for row, count in runs:
+            model.removeRows(row, count)
+        if len(runs) > 1:
+            model.stack.endMacro()
 
     def contextMenuEvent(self,event):
         # make a popup menu
@@ -313,6 +337,8 @@ class GUI(QMainWindow):
         QMainWindow.__init__(self)
         # initialise filename
         self.filename = None
+        # the Loader for a file being opened
+        self.loader = None
         # make the data store
         from .xmlstore import Store
         self.store = Store(debug = debug)
@@ -362,6 +388,8 @@ class GUI(QMainWindow):
         self.menuFile.addSeparator()
         self.menuFile.addAction('Set Architecture...', self.setArch)
         self.menuFile.addSeparator()
+        self.menuFile.addAction('Build IOC', self.Build).setShortcut('CTRL+B')
+        self.menuFile.addSeparator()
         self.menuFile.addAction('Quit', self.closeEvent).setShortcuts(['CTRL+Q', 'ALT+F4'])
         # create edit menu headings
         self.menuEdit = self.menu.addMenu('Edit')
@@ -388,15 +416,18 @@ class GUI(QMainWindow):
             self.tableView.pythonCode).setShortcut('CTRL+P')
         self.tableView.codeBox = pythonCode()
         self.menuEdit.addSeparator()
-        self.menuEdit.addAction('Undo', self.store.stack.undo).setShortcut('CTRL+Z')
-        self.menuEdit.addAction('Redo', self.store.stack.redo).setShortcut('CTRL+SHIFT+Z')
+        # the store is replaced when a file is opened
+        self.menuEdit.addAction('Undo',
+            lambda: self.store.stack.undo()).setShortcut('CTRL+Z')
+        self.menuEdit.addAction('Redo',
+            lambda: self.store.stack.redo()).setShortcut('CTRL+SHIFT+Z')
         # create component menu
         self.menuComponents = self.menu.addMenu('Components')
         self.resize(QSize(1000,500))
 
     def Save(self):
         # save menu command
-        self.SaveAs(self.filename)
+        self.SaveAs(self.filename or '')
 
     def setArch(self):
         arch = self.store.getArch()
@@ -428,25 +459,30 @@ class GUI(QMainWindow):
             filename = str(QFileDialog.getOpenFileName(filter="Xml Files (*.xml);;All files (*.*)"))
         if filename == '':
             return
+        # load it in the background, finishing in Opened
+        self.__load(filename, name)
+
+    def Opened(self, store, filename, name, result, errors):
+        # called by the Loader when filename has been opened into store
+        self.__setStore(store)
         # store the filename
         self.filename = filename
-        # tell the store to open a new set of tables
-        try:
-            problems, warnings = self.store.Open(filename)
-            if problems:
-                errorstr = 'Can\'t load all object types: '+', '.join(problems)
-                QMessageBox.warning(self,'Open Error',errorstr)
-            if warnings:
-                errorstr = \
-                    'The following warnings were generated:\n' + \
-                    '\n'.join(warnings)
-                QMessageBox.warning(self,'Open Warnings',errorstr)
-        except Exception as e:
-            x = formLog('An error ocurred. Make sure all the modules listed '
-                'in RELEASE files are built. Check the text below for '
-                'details:\n\n' + traceback.format_exc(), self)
-            x.show()
-            return
+        problems, warnings = result
+        if problems:
+            errorstr = 'Can\'t load all object types: '+', '.join(problems)
+            QMessageBox.warning(self,'Open Error',errorstr)
+        if warnings:
+            errorstr = \
+                'The following warnings were generated:\n' + \
+                '\n'.join(warnings)
+            QMessageBox.warning(self,'Open Warnings',errorstr)
+        elif errors:
+            # the warnings cover most of what validation finds, so only
+            # report its errors if there weren't any
+            errorstr = \
+                'The following problems were found:\n' + \
+                '\n'.join(errors)
+            QMessageBox.warning(self,'Open Warnings',errorstr)
         # populate
         self.setWindowTitle('XEB - %s[*]'%filename)
         self.listView.clear()
@@ -457,7 +493,7 @@ class GUI(QMainWindow):
         self._setClean()
 
     def __insertListViewItem(self, name, row = None):
-        ob = self.store._tables[name].ob
+        ob = self.store.getClass(name)
         item = QListWidgetItem(name)
         doc = str(ob.__doc__)
         search = re.search(r'\n[ \t]*', doc)
@@ -474,15 +510,12 @@ class GUI(QMainWindow):
         # make sure the user is sure if there are unsaved changes
         if self.__prompt_unsaved() == QMessageBox.Cancel:
             return
-        # tell the store to create a new set of tables
-        try:
-            self.store.New(filename)
-        except Exception as e:
-            x = formLog('An error ocurred. Make sure all the modules listed '
-                'in RELEASE files are built. Check the text below for '
-                'details:\n\n' + traceback.format_exc(), self)
-            x.show()
-            return
+        # create a new set of tables in the background, finishing in Created
+        self.__load(filename, new = True)
+
+    def Created(self, store, filename, name, result, errors):
+        # called by the Loader when a new set of tables has been made
+        self.__setStore(store)
         self.filename = filename
         self.setWindowTitle('XEB - %s[*]' % (filename or "<untitled>"))
         self.listView.clear()
@@ -492,6 +525,45 @@ class GUI(QMainWindow):
         self._setClean()
 
 
+    def __load(self, filename, name = None, new = False):
+        # abandon anything that is still loading
+        if self.loader is not None:
+            self.loader.cancel()
+        try:
+            self.loader = Loader(self, filename, name, new)
+        except Exception as e:
+            self.LoadFailed(traceback.format_exc())
+
+    def LoadFailed(self, text):
+        # called by the Loader if the file couldn't be loaded
+        self.loader = None
+        x = formLog('An error ocurred. Make sure all the modules listed '
+            'in RELEASE files are built. Check the text below for '
+            'details:\n\n' + text, self)
+        x.show()
+
+    def __setStore(self, store):
+        # replace the store with one made by the Loader
+        self.loader = None
+        self.tablename = None
+        self.tableView.setModel(None)
+        self.store = store
+        self.undoView.setGroup(store.stack)
+
+    def Build(self):
+        # build the ioc from the saved file in a separate process
+        if not self.filename or self.isWindowModified():
+            if QMessageBox.question(self, 'Build IOC',
+                    'The file must be saved before the IOC can be built, '
+                    'save it now?', QMessageBox.Save | QMessageBox.Cancel
+                    ) != QMessageBox.Save:
+                return
+            self.Save()
+            if not self.filename or self.isWindowModified():
+                return
+        x = buildLog(self.filename, self)
+        x.show()
+
     def closeEvent(self, event=None):
         # override closeEvent so we can check things have been saved
         if self.__prompt_unsaved() == QMessageBox.Cancel:
@@ -525,7 +597,7 @@ class GUI(QMainWindow):
         autos = []
         normals = []
         for name in self.store.allTableNames():
-            ob = self.store._tables[name].ob
+            ob = self.store.getClass(name)
             if ob.ModuleName not in modules:
                 modules[ob.ModuleName] = TooltipMenu(ob.ModuleName, self.menuComponents)
                 self.menuComponents.addMenu(modules[ob.ModuleName])
@@ -559,7 +631,7 @@ class GUI(QMainWindow):
             if names:
                 name = names[0]
             else:
-                name = sorted(self.store._tables.keys())[0]
+                name = self.store.allTableNames()[0]
         table = self.store.getTable(name)
         # make sure the listView is up to date
         items = self.listView.findItems(name, Qt.MatchExactly)
@@ -618,6 +690,170 @@ class formLog(QDialog):
         formLayout.addWidget(self.btnClose,3,2,1,1)
         self.btnClose.clicked.connect(self.close)
 
+class buildLog(formLog):
+    '''Runs the xml builder on a file in a separate process and shows its
+    output'''
+    def __init__(self, filename, *args):
+        formLog.__init__(self, '', *args)
+        self.setWindowTitle('Build %s' % os.path.basename(filename))
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
+        self.process.setWorkingDirectory(
+            os.path.dirname(os.path.abspath(filename)))
+        self.process.readyReadStandardOutput.connect(self.readOutput)
+        self.process.finished.connect(self.buildFinished)
+        self.process.start(sys.executable, [
+            '-c', 'from xmlbuilder.xmlbuilder import main; main()',
+            '--lazy', os.path.abspath(filename)])
+
+    def readOutput(self):
+        text = bytes(self.process.readAllStandardOutput())
+        self.lab.moveCursor(QTextCursor.End)
+        self.lab.insertPlainText(text.decode(errors = 'replace'))
+
+    def buildFinished(self, exitCode, exitStatus):
+        if exitStatus == QProcess.NormalExit and exitCode == 0:
+            self.lab.append('\n*** Build succeeded')
+        else:
+            self.lab.append('\n*** Build failed')
+
+    def closeEvent(self, event):
+        # stop the build if it is still running
+        if self.process.state() != QProcess.NotRunning:
+            self.process.kill()
+            self.process.waitForFinished()
+        formLog.closeEvent(self, event)
+
+class Loader(object):
+    '''Opens filename, or makes a new set of tables, without blocking the
+    gui.  Configuring iocbuilder, scanning the modules and checking the file
+    are done in a worker process, which brings the catalog and template
+    caches up to date, then the tables are made a few components at a time
+    in a new Store which replaces the gui's store when it is complete.
+    Progress is shown in a dialog which allows it to be cancelled.'''
+    # seconds of each timer tick spent making tables
+    slice = 0.05
+
+    def __init__(self, gui, filename, name = None, new = False):
+        self.gui = gui
+        self.filename = filename
+        self.name = name
+        self.new = new
+        if new:
+            arch = gui.store.getArch()
+            simarch = gui.store.simarch
+        else:
+            arch = read_architecture(filename)
+            simarch = None
+        # the worker mustn't inherit the gui, so don't fork it
+        context = multiprocessing.get_context('spawn')
+        self.queue = context.Queue()
+        self.process = context.Process(
+            target = xmlworker.load,
+            args = (self.queue, filename, arch, simarch, gui.store.debug))
+        self.process.daemon = True
+        self.process.start()
+        # generator making the tables, once the worker is done
+        self.steps = None
+        self.errors = []
+        self.dialog = QProgressDialog(
+            'Loading modules...', 'Cancel', 0, 0, gui)
+        self.dialog.setWindowTitle('Loading %s' %
+            (os.path.basename(filename) or '<untitled>'))
+        self.dialog.setWindowModality(Qt.NonModal)
+        self.dialog.setMinimumDuration(0)
+        self.dialog.canceled.connect(self.cancel)
+        self.dialog.show()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(50)
+
+    def poll(self):
+        try:
+            if self.steps is None:
+                self.__readQueue()
+            else:
+                self.__makeTables()
+        except Exception:
+            self.__finish()
+            self.gui.LoadFailed(traceback.format_exc())
+
+    def __readQueue(self):
+        # handle messages from the worker
+        while True:
+            try:
+                message, value = self.queue.get_nowait()
+            except queue.Empty:
+                if not self.process.is_alive():
+                    # check nothing arrived as it finished
+                    try:
+                        message, value = self.queue.get(timeout = 1)
+                    except queue.Empty:
+                        raise AssertionError('Worker process exited with '
+                            'code %s' % self.process.exitcode)
+                else:
+                    return
+            if message == 'progress':
+                self.dialog.setLabelText(value)
+            elif message == 'error':
+                self.__finish()
+                self.gui.LoadFailed(value)
+                return
+            else:
+                self.errors = value
+                self.process.join()
+                self.__startTables()
+                return
+
+    def __startTables(self):
+        # make the tables in a new store, a few at a time
+        from .xmlstore import Store
+        self.store = Store(debug = self.gui.store.debug,
+            arch = self.gui.store.getArch())
+        if self.new:
+            self.store.simarch = self.gui.store.simarch
+            self.steps = self.__newSteps()
+        else:
+            self.steps = self.store.OpenSteps(self.filename)
+        self.dialog.setLabelText('Making tables...')
+
+    def __newSteps(self):
+        yield from self.store.NewSteps(self.filename)
+        return [], []
+
+    def __makeTables(self):
+        end = time.time() + self.slice
+        count = 0
+        try:
+            while time.time() < end:
+                count = next(self.steps)
+        except StopIteration as e:
+            self.__finish()
+            if self.new:
+                self.gui.Created(self.store, self.filename, self.name,
+                    e.value, self.errors)
+            else:
+                self.gui.Opened(self.store, self.filename, self.name,
+                    e.value, self.errors)
+        else:
+            self.dialog.setLabelText(
+                'Making tables: %d components read' % count)
+
+    def __finish(self):
+        self.timer.stop()
+        self.dialog.canceled.disconnect(self.cancel)
+        self.dialog.close()
+
+    def cancel(self):
+        # stop loading, leaving the gui as it was
+        self.__finish()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.steps = None
+        if self.gui.loader is self:
+            self.gui.loader = None
+
 class pythonCode(formLog):
     def __init__(self,*args):
         formLog.__init__(self,"text = text.replace('.', '-')",*args)
@@ -633,7 +869,7 @@ class pythonCode(formLog):
         code = str(self.lab.toPlainText())
         self.selRange = self.parent.selectedIndexes()
         model = self.selRange[0].model()
-        model.stack.beginMacro('Run python code')
+        changes = []
         for cell in self.selRange:
             text = str(cell.data())
             env = dict(cell = cell, text = text)
@@ -643,9 +879,9 @@ class pythonCode(formLog):
                 print("Failed")
             else:
                 if env["text"] != text:
-                    index = model.index(cell.row(), cell.column())
-                    model.setData(index, QVariant(env["text"]), Qt.EditRole)
-        model.stack.endMacro()
+                    changes.append(
+                        (cell.row(), cell.column(), QVariant(env["text"])))
+        model.setCells(changes, 'Run python code')
 
 def main():
     parser = OptionParser('usage: %prog [options] [<xml-file>]')
@@ -3,12 +3,11 @@ import glob
 import os
 import sys
 import shutil
-import xml.dom.minidom
 
 from subprocess import *
 from optparse import OptionParser
 
-from xmlbuilder.xmlconfig import XmlConfig
+from xmlbuilder.xmlconfig import XmlConfig, read_architecture
 
 
 # hacky hacky change linux-x86 to linux-x86_64 in RHEL6
@@ -49,6 +48,46 @@ def main():
     parser.add_option(
         '--build-debug', action='store_true', dest='build_debug',
         help='Enable debug build of IOC')
+    parser.add_option(
+        '--prune-records', action='store_true', dest='prune_records',
+        help='Remove calc, fanout, seq and similar records which nothing uses')
+    parser.add_option(
+        '--prune-allow', action='append', dest='prune_allow', default=[],
+        metavar='PATTERN',
+        help='Never remove records matching PATTERN, may be repeated')
+    parser.add_option(
+        '--balance-phases', action='store_true', dest='balance_phases',
+        help='Spread periodically scanned records across scan phases')
+    parser.add_option(
+        '--link-report', action='store_true', dest='link_report',
+        help='Write a report of the links between records next to the db')
+    parser.add_option(
+        '--memory-report', action='store_true', dest='memory_report',
+        help='Write an estimate of the database memory next to the db')
+    parser.add_option(
+        '--memory-budget', dest='memory_budget', type='int',
+        help='Fail if the estimated database memory exceeds MEMORY_BUDGET '
+        'bytes')
+    parser.add_option(
+        '--load-report', action='store_true', dest='load_report',
+        help='Write an estimate of the load of each scan rate next to the db')
+    parser.add_option(
+        '--load-budget', dest='load_budget', type='float',
+        help='Warn if the estimated scan load exceeds LOAD_BUDGET '
+        'records/second')
+    parser.add_option(
+        '--data-staging', dest='data_staging', metavar='METHODS',
+        help='Stage data files by trying each of the comma separated METHODS '
+        'in turn: unchanged, hardlink, reflink, copy_range, copy')
+    parser.add_option(
+        '--size-queues', action='store_true', dest='size_queues',
+        help='Size the callback and scan once queues from the records')
+    parser.add_option(
+        '--boot-timing', action='store_true', dest='boot_timing',
+        help='Mark each section of the startup script with the time')
+    parser.add_option(
+        '--lazy', action='store_true', dest='lazy',
+        help='Only load module definitions for components used by the IOC')
 
     # parse arguments
     (options, args) = parser.parse_args()
@@ -67,30 +106,27 @@ def main():
     else:
         DbOnly = False
 
-    # read the xml text for the architecture
+    # read the architecture from the root element of the xml file
     xml_file = args[0]
     if options.debug:
         print('--- Parsing %s ---' % xml_file)
-    xml_text = open(xml_file).read()
-    xml_root = xml.dom.minidom.parseString(xml_text)
-    components = [n
-        for n in xml_root.childNodes if n.nodeType == n.ELEMENT_NODE][0]
     if options.simarch is not None:
         architecture = patch_arch(options.simarch)
         simarch = architecture
     else:
-        architecture = patch_arch(str(components.attributes['arch'].value))
+        architecture = patch_arch(read_architecture(xml_file))
         simarch = None
 
     # setup the XmlIocBuilder
     xml_config = XmlConfig(debug=debug, DbOnly=DbOnly,
                            doc=options.doc, arch=architecture,
-                           simarch=simarch, filename=xml_file)
+                           simarch=simarch, filename=xml_file,
+                           lazy=options.lazy)
     xml_config.iocbuilder.SetSource(os.path.realpath(xml_file))
     xml_config.iocbuilder.SetAdditionalHeaderText(get_git_status(xml_file))
 
-    # create iocbuilder objects from the xml text
-    xml_config.iocbuilder.includeXml.instantiateXml(xml_text)
+    # create iocbuilder objects from the xml file as it is read
+    xml_config.iocbuilder.includeXml.instantiateXmlFile(xml_file)
 
     if options.doc:
         iocpath = options.doc
@@ -109,6 +145,13 @@ def main():
     substitute_boot = not options.no_substitute_boot
     if xml_config.architecture == "win32-x86":
         substitute_boot = False
+    if options.size_queues:
+        xml_config.iocbuilder.AutoSizeQueues()
+    if options.boot_timing:
+        xml_config.iocbuilder.SetBootTiming()
+    data_staging = None
+    if options.data_staging:
+        data_staging = options.data_staging.split(',')
     if debug:
         print("Writing ioc to %s" % iocpath)
     xml_config.iocbuilder.WriteNamedIoc(iocpath,
@@ -116,7 +159,16 @@ def main():
                                         check_release=not options.no_check_release,
                                         substitute_boot=substitute_boot,
                                         edm_screen=options.edm_screen,
-                                        build_debug=options.build_debug)
+                                        build_debug=options.build_debug,
+                                        prune_records=options.prune_records,
+                                        prune_allow=options.prune_allow,
+                                        balance_phases=options.balance_phases,
+                                        link_report=options.link_report,
+                                        memory_report=options.memory_report,
+                                        memory_budget=options.memory_budget,
+                                        load_report=options.load_report,
+                                        load_budget=options.load_budget,
+                                        data_staging=data_staging)
 
     if debug:
         print("Done")
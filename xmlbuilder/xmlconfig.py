@@ -1,11 +1,20 @@
 import os
 import sys
+import xml.etree.ElementTree as ET
+
+
+def read_architecture(filename):
+    '''Return the arch attribute of the root element of an IOC xml file,
+    without parsing the rest of the file'''
+    for event, root in ET.iterparse(filename, ['start']):
+        return str(root.attrib['arch'])
 
 
 class XmlConfig(object):
     def __init__(self, debug=False, DbOnly=False,
                  doc=False, arch='vxWorks-ppc604_long',
-                 simarch=False, filename=""):
+                 simarch=False, filename="", lazy=False, progress=None,
+                 prescan=True, configure=True):
         self.architecture = arch
         self.simarch = simarch
         self.epics_base = None
@@ -13,6 +22,12 @@ class XmlConfig(object):
         self.debug = debug
         self.DbOnly = DbOnly
         self.doc = doc
+        self.lazy = lazy
+        # called with a description of each module as it is configured
+        self.progress = progress
+        # every template is scanned for the auto objects, so do it in parallel
+        # unless told not to start any processes
+        self.prescan = prescan
         self.iocname = os.path.basename(filename).replace('.xml', '')
         if filename:
             self.build_root = os.path.dirname(os.path.abspath(filename))
@@ -21,9 +36,17 @@ class XmlConfig(object):
         if self.debug:
             print("IOC name: %s" % self.iocname)
             print("Build root: %s" % self.build_root)
-        self.configureIocbuilder()
+        # otherwise the caller runs configureSteps()
+        if configure:
+            self.configureIocbuilder()
 
     def configureIocbuilder(self):
+        for step in self.configureSteps():
+            pass
+
+    def configureSteps(self):
+        '''Generator that configures iocbuilder, yielding after the module
+        versions are made and after the auto objects of each module'''
         # Now make sure there is no iocbuilder hanging around
         for k in [k for k in sys.modules if k.startswith('iocbuilder')]:
             del sys.modules[k]
@@ -42,9 +65,15 @@ class XmlConfig(object):
         # do the moduleversion calls
         from dls_dependency_tree import dependency_tree
         vs = self.iocbuilder.ParseAndConfigure(self, dependency_tree)
+        yield
         # create AutoSubstitutions and moduleObjects
         for v in vs:
             if self.debug:
                 print('Making auto objects from %s' % v.LibPath())
+            if self.progress:
+                self.progress('Making auto objects from %s' % v.Name())
             iocbuilder.AutoSubstitution.fromModuleVersion(v)
             iocbuilder.Xml.fromModuleVersion(v)
+            # record its classes so they can be listed without loading it
+            iocbuilder.catalog.Register(v)
+            yield
@@ -1,16 +1,31 @@
+import itertools
 import os
 import sys
+import tempfile
 import traceback
 import time
 import xml.dom.minidom
+import xml.etree.ElementTree as ET
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QUndoGroup
 
+from xmlbuilder.nameindex import NameIndex
 from xmlbuilder.xmlconfig import XmlConfig
 from xmlbuilder.xmltable import Table
 
 
+def _fileMode(filename):
+    # the permissions for a new version of filename, the same as the old
+    # version or as for a newly created file if there isn't one
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
 class Store(object):
     def __init__(self, debug = False, DbOnly = False, doc = False,
             arch = 'vxWorks-ppc604_long'):
@@ -22,9 +37,12 @@ class Store(object):
         self.iocname = 'example'
         # This the group of undo stacks for each table
         self.stack = QUndoGroup()
-        # this is a dict of tables
+        # this is a dict of classes, and of the tables made for them so far
+        self._classes = {}
         self._tables = {}
         self._tableNames = []
+        # this is the index of object names in the displayed tables
+        self.names = NameIndex(self)
         # store the debug state
         self.debug = debug
         self.DbOnly = DbOnly
@@ -60,92 +78,135 @@ class Store(object):
     def New(self, filename = ""):
         '''Create a new table list by setting up ModuleVersion calls according
         to paths in release'''
+        for step in self.NewSteps(filename):
+            pass
+
+    def NewSteps(self, filename = ""):
+        '''Generator that does New a module at a time, yielding 0 as the
+        number of components read after each step'''
         # First clear up the undo stack
         for stack in self.stack.stacks():
             self.stack.removeStack(stack)
         # then clear the table list
+        self._classes.clear()
         self._tables.clear()
         # then clear the display list
         self._tableNames = []
         self._stored_tableNames = []
+        self.names.clear()
         xml_config = XmlConfig(debug=self.debug, DbOnly=self.DbOnly,
                                doc=self.doc, arch=self.architecture,
-                               simarch=self.simarch, filename=filename)
-        # create our dict of classes
-        classes = xml_config.iocbuilder.includeXml.createClassLookup()
-        # now we can make our tables
-        for name, o in list(classes.items()):
-            # make a table object
-            table = Table(o, self)
-            # add it to our internal dict of tables
-            self._tables[name] = table
-            # add the undo stack
-            self.stack.addStack(table.stack)
-            # connect its modified signal to store a timestamp
-            table.dataChanged.connect(self.setLastModified)
+                               simarch=self.simarch, filename=filename,
+                               lazy=True, configure=False)
+        for step in xml_config.configureSteps():
+            yield 0
+        # create our dict of classes, tables are made when they are first used
+        self._classes.update(
+            xml_config.iocbuilder.includeXml.createClassLookup())
         self.setStored()
         # failure if there were no callables
         self.setLastModified()
 
 
     def Open(self, filename, sim = None):
+        steps = self.OpenSteps(filename, sim)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as e:
+                return e.value
+
+    def OpenSteps(self, filename, sim = None):
+        '''Generator that opens filename a component at a time, yielding the
+        number of components read so far and returning (problems, warnings)
+        '''
         if self.debug:
             print('--- Parsing %s ---'%filename)
-        # read the tables
-        xml_root = xml.dom.minidom.parse(filename)
-        # find the root node
-        components = self._elements(xml_root)[0]
-        if sim is not None:
-            self.architecture = sim
-            self.simarch = self.architecture
-        else:
-            self.architecture = str(components.attributes['arch'].value)
-            self.simarch = None
-        self.New(filename)
-        # proccess each component in turn
+        # proccess each component in turn as the file is read
         problems = []
         warnings = []
         commentText = ""
-        for node in components.childNodes:
-            # try to find the class of each component
-            if node.nodeType == node.COMMENT_NODE:
+        count = 0
+        for event, node in self._components(filename):
+            if event == 'start':
+                # this is the root node
+                if sim is not None:
+                    self.architecture = sim
+                    self.simarch = self.architecture
+                else:
+                    self.architecture = str(node.attrib['arch'])
+                    self.simarch = None
+                yield from self.NewSteps(filename)
+                continue
+            elif event == 'comment':
                 # If it's a comment, then mark as a comment and try to process
                 # its content
                 commented = True
-                text = '<junk>'+node.toxml()[4:-3]+'</junk>'
-                root = self._elements(xml.dom.minidom.parseString(text.replace("&dashdash;","--")))[0]
-                nodes = self._elements(root)
+                text = '<junk>'+node.text+'</junk>'
+                root = ET.fromstring(text.replace("&dashdash;","--"))
+                nodes = list(root)
                 if len(nodes) == 0:
                     # treat this as a comment on the next node
-                    commentText += str(node.nodeValue) + "\n"
-            elif node.nodeType == node.ELEMENT_NODE:
+                    commentText += str(node.text) + "\n"
+            else:
                 # If it's an element node, then just add this node
                 commented = False
                 nodes = [node]
-            else:
-                # Ignore whitespace
-                continue
             for node in nodes:
                 # find the correct table
-                obname = str(node.nodeName)
-                if obname in self._tables:
+                obname = str(node.tag)
+                if obname in self._classes:
                     pass
-                elif obname.replace("auto_", "") in self._tables:
-                    node.nodeName = obname.replace("auto_", "")
-                    obname = str(node.nodeName)
+                elif obname.replace("auto_", "") in self._classes:
+                    node.tag = obname.replace("auto_", "")
+                    obname = str(node.tag)
                 else:
                     problems.append(obname)
                     continue
                 table = self.getTable(obname)
                 if obname not in self._tableNames:
                     self._tableNames.append(obname)
+                    self.names.tablesChanged()
                 # make a new row
                 warnings += table.addNode(node, commented, commentText)
                 commentText = ""
+                count += 1
+                yield count
         self.setStored()
         self.setLastModified()
         return self._unique(problems, warnings)
 
+    def _components(self, filename):
+        # Reads filename incrementally, yielding ('start', root) for the root
+        # node followed by ('comment', node) and ('end', node) for each
+        # comment and component inside it.  Components are discarded once
+        # they have been processed.
+        target = _EventTarget()
+        parser = ET.XMLParser(target = target)
+        root = None
+        depth = 0
+        def events():
+            nonlocal root, depth
+            for event, node in target.read_events():
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        root = node
+                        yield event, node
+                elif event == 'end':
+                    depth -= 1
+                    if depth == 1:
+                        yield event, node
+                        root.remove(node)
+                elif depth == 1:
+                    yield event, node
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                parser.feed(chunk)
+                yield from events()
+        parser.close()
+        yield from events()
+
     def _unique(self, *ls):
         # make each list in args unique, then return a tuple of them
         ret = []
@@ -157,34 +218,73 @@ class Store(object):
             ret.append(newl)
         return tuple(ret)
 
-    def _elements(self,xml):
-        return [n for n in xml.childNodes if n.nodeType == n.ELEMENT_NODE]
-
     def Save(self, filename):
-        # write the tables to disk
+        # write the tables to disk, in the same format as toprettyxml but
+        # writing each node as it is made rather than building the whole
+        # document.  The file is written alongside and moved into place
+        # so a failed save leaves the old file intact.
         impl = xml.dom.minidom.getDOMImplementation()
         doc = impl.createDocument(None, 'components', None)
+        root = doc.documentElement
+        root.setAttribute('arch',self.architecture)
         # look at each table that is displayed
-        for name in self._tableNames:
-            table = self._tables[name]
-            # make the xml elements and add them to doc
-            table.createElements(doc, name)
-        doc.documentElement.setAttribute('arch',self.architecture)
-        text = doc.toprettyxml()
-        open(filename,'w').write(text)
+        nodes = itertools.chain.from_iterable(
+            self._table(name).createNodes(doc, name)
+            for name in self._tableNames)
+        first = next(nodes, None)
+        # replace the file a link points to rather than the link
+        filename = os.path.realpath(filename)
+        fd, tempname = tempfile.mkstemp(
+            dir = os.path.dirname(filename), suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                if first is None:
+                    f.write(doc.toprettyxml())
+                else:
+                    # get the tags for the root around a placeholder
+                    placeholder = root.appendChild(doc.createComment(''))
+                    start, end = doc.toprettyxml().split(
+                        '\t' + placeholder.toprettyxml())
+                    f.write(start)
+                    for node in itertools.chain([first], nodes):
+                        node.writexml(f, '\t', '\t', '\n')
+                    f.write(end)
+            os.chmod(tempname, _fileMode(filename))
+            os.replace(tempname, filename)
+        except:
+            os.unlink(tempname)
+            raise
         self.setStored()
 
+    def _table(self, name):
+        # return the table, making it if this is the first time it is used
+        if name not in self._tables:
+            # make a table object
+            table = Table(self._classes[name], self)
+            # add it to our internal dict of tables
+            self._tables[name] = table
+            # add the undo stack
+            self.stack.addStack(table.stack)
+            # connect its modified signal to store a timestamp
+            table.dataChanged.connect(self.setLastModified)
+        return self._tables[name]
+
     def getTable(self, name):
         # return the table
-        table = self._tables[name]
+        table = self._table(name)
         self.stack.setActiveStack(table.stack)
         return table
 
+    def getClass(self, name):
+        # return the class of the table without making the table
+        return self._classes[name]
+
     def allTableNames(self):
-        return sorted(self._tables.keys())
+        return sorted(self._classes.keys())
 
     def setTableNames(self, names):
         self._tableNames = names
+        self.names.tablesChanged()
 
     def getTableNames(self):
         return self._tableNames
@@ -194,3 +294,38 @@ class Store(object):
 
     def setArch(self, arch):
         self.architecture = arch
+
+
+class _EventTarget(object):
+    '''Parser target building the tree like ET.TreeBuilder while recording
+    start, end and comment events.  XMLPullParser only reports comments from
+    Python 3.8'''
+    def __init__(self):
+        self._builder = ET.TreeBuilder()
+        self._events = []
+
+    def start(self, tag, attrib):
+        node = self._builder.start(tag, attrib)
+        self._events.append(('start', node))
+        return node
+
+    def end(self, tag):
+        node = self._builder.end(tag)
+        self._events.append(('end', node))
+        return node
+
+    def data(self, data):
+        self._builder.data(data)
+
+    def comment(self, text):
+        node = ET.Comment(text)
+        self._events.append(('comment', node))
+        return node
+
+    def close(self):
+        return self._builder.close()
+
+    def read_events(self):
+        # the events since the last call
+        events, self._events = self._events, []
+        return events
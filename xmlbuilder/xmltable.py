@@ -1,5 +1,4 @@
 import re
-import time
 import types
 
 from PyQt5.QtCore import (Qt, QAbstractTableModel, QMimeData,
@@ -7,7 +6,7 @@ from PyQt5.QtCore import (Qt, QAbstractTableModel, QMimeData,
 from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import QUndoCommand, QUndoStack
 
-from xmlbuilder.commands import ChangeValueCommand, RowCommand
+from xmlbuilder.commands import ChangeValueCommand, CellsCommand, RowCommand
 
 class Table(QAbstractTableModel):
 
@@ -38,6 +37,10 @@ class Table(QAbstractTableModel):
         # _cValues is a dict of column -> list of QVariant values, stored when
         # corresponding label stored by combobox
         self._cValues = {}
+        # _cItemSet and _cValueSet are sets of the contents of _cItems and
+        # _cValues for validation, normalised by _valueKey
+        self._cItemSet = {}
+        self._cValueSet = {}
         # _idents is a list of identifier lookup fields
         self._idents = []
         # _types is a list of types for validation
@@ -55,8 +58,8 @@ class Table(QAbstractTableModel):
         # for optional names flag it as optional
         for name in a.optional_names:
             self.__processArgType(name, a.descriptions[name], optional = True)
-        # maps (filt, without, upto) -> (timestamp, stringList)
-        self._cachedNameList = {}
+        # maps (row, col) -> (cell, stamp, result of _isInvalid)
+        self._validity = {}
         # this is the top left item visible in the TableView widget
         self.topLeftIndex = None
 
@@ -87,9 +90,11 @@ class Table(QAbstractTableModel):
         # if we have combo box items
         if hasattr(ob, 'labels'):
             self._cItems[col] = QVariant([str(x) for x in ob.labels])
+            self._cItemSet[col] = set(_valueKey(str(x)) for x in ob.labels)
         # if we have combo box values
         if hasattr(ob, 'values'):
             self._cValues[col] = [QVariant(x) for x in ob.values]
+            self._cValueSet[col] = set(_valueKey(x) for x in ob.values)
         # if it's an ident
         if hasattr(ob, 'ident'):
             self._idents.append(col)
@@ -130,8 +135,8 @@ class Table(QAbstractTableModel):
         else:
             return (variant.value(), False)
 
-    def createElements(self, doc, name):
-        # create xml elements from this table
+    def createNodes(self, doc, name):
+        # generate xml elements and comments from this table, a row at a time
         header = [ str(x.value()) for x in self._header ]
         for row in self.rows:
             el = doc.createElement(name)
@@ -144,11 +149,11 @@ class Table(QAbstractTableModel):
                         val = val.title()
                     el.setAttribute(header[i], val)
             if not row[1].isNull() and str(row[1].value()):
-                doc.documentElement.appendChild(doc.createComment(str(row[1].value()).strip()))
+                yield doc.createComment(str(row[1].value()).strip())
             if row[0].value() is True:
                 # can't put -- in a comment unfortunately...
                 el = doc.createComment(el.toxml().replace("--", "&dashdash;"))
-            doc.documentElement.appendChild(el)
+            yield el
 
     def addNode(self, node, commented = False, commentText = ""):
         # add xml nodes as rows in the table
@@ -159,7 +164,8 @@ class Table(QAbstractTableModel):
             row[0] = QVariant(True)
         else:
             row[0] = QVariant(False)
-        for attr, value in list(node.attributes.items()):
+        self._parent.names.rowInserted(self, len(self.rows)-1)
+        for attr, value in list(node.attrib.items()):
             attr = str(attr)
             value = str(value)
             index = -1
@@ -168,16 +174,17 @@ class Table(QAbstractTableModel):
                     index = i
                     break
             if index == -1:
-                w.append('%s doesn\'t have attr %s' % (node.nodeName, attr))
+                w.append('%s doesn\'t have attr %s' % (node.tag, attr))
                 continue
             typ = self._types[index]
             row[index] = QVariant(self.__convert(QVariant(value), typ)[0])
             if not commented:
                 invalid = self._isInvalid(row[index], len(self.rows)-1, index)
                 if invalid:
-                    w.append('%s.%s: %s' %(node.nodeName, attr, invalid))
+                    w.append('%s.%s: %s' %(node.tag, attr, invalid))
         # add the row to the table
         row[1] = QVariant(commentText)
+        self._parent.names.rowChanged(self, len(self.rows)-1)
         return w
 
     def flags(self, index):
@@ -204,46 +211,54 @@ class Table(QAbstractTableModel):
             return QVariant()
 
 
-    # put the change request on the undo stack
-    def setData(self, index, val, role=Qt.EditRole):
+    def __editValue(self, row, col, val):
+        # returns the value to store when the user sets a cell to val, or
+        # None if it is unchanged
         # if val is not already a a QVariant, make it one
         qvar = QVariant(val)
-        if role == Qt.EditRole and \
-                qvar.value() != self.rows[index.row()][index.column()].value():
-            col = index.column()
-            if col in self._cValues:
-                # lookup the display in the list of _cItems
-                for i, v in enumerate(self._cItems[col].value()):
-                    if str(v).lower() == str(qvar.value()).lower():
-                        qvar = self._cValues[col][i]
-            # convert back to correct type before setting data
-            typ = self._types[index.column()]
-            v, ret = self.__convert(qvar, typ)
-            # col 0 must be boolean, assume any other type pasted there is
-            # intended as a comment unless it is an empty string
-            if index.column() == 0 and not ret and str(qvar.value()):
-                v = True
-            self.stack.push(
-                ChangeValueCommand(index.row(), index.column(), QVariant(v), self))
-            return True
-        else:
-            return False
+        if qvar.value() == self.rows[row][col].value():
+            return None
+        if col in self._cValues:
+            # lookup the display in the list of _cItems
+            for i, v in enumerate(self._cItems[col].value()):
+                if str(v).lower() == str(qvar.value()).lower():
+                    qvar = self._cValues[col][i]
+        # convert back to correct type before setting data
+        typ = self._types[col]
+        v, ret = self.__convert(qvar, typ)
+        # col 0 must be boolean, assume any other type pasted there is
+        # intended as a comment unless it is an empty string
+        if col == 0 and not ret and str(qvar.value()):
+            v = True
+        return QVariant(v)
+
+    # put the change request on the undo stack
+    def setData(self, index, val, role=Qt.EditRole):
+        if role == Qt.EditRole:
+            v = self.__editValue(index.row(), index.column(), val)
+            if v is not None:
+                self.stack.push(
+                    ChangeValueCommand(index.row(), index.column(), v, self))
+                return True
+        return False
+
+    def setCells(self, cells, text):
+        # set a list of (row, col, val) cells as a single undo step, cells
+        # outside the table are ignored
+        changes = []
+        for row, col, val in cells:
+            if 0 <= row < len(self.rows) and 0 <= col < len(self._header):
+                v = self.__editValue(row, col, val)
+                if v is not None:
+                    changes.append((row, col, v))
+        if changes:
+            self.stack.push(CellsCommand(changes, self, text))
 
     def insertRows(self, row, count, parent = QModelIndex()):
-        if count > 1:
-            self.stack.beginMacro('Insert rows %d..%d'%(row+1, row+count))
-        for row in range(row, row+count):
-            self.stack.push(RowCommand(row, self, parent))
-        if count > 1:
-            self.stack.endMacro()
+        self.stack.push(RowCommand(row, self, parent, count = count))
 
     def removeRows(self, row, count, parent = QModelIndex()):
-        if count > 1:
-            self.stack.beginMacro('Remove rows %d..%d'%(row+1, row+count))
-        for row in reversed(list(range(row, row+count))):
-            self.stack.push(RowCommand(row, self, parent, False))
-        if count > 1:
-            self.stack.endMacro()
+        self.stack.push(RowCommand(row, self, parent, False, count))
 
     def sectionMoved(self, logicalIndex, oldVisualIndex, newVisualIndex, parent = QModelIndex()):
         assert oldVisualIndex == logicalIndex, \
@@ -256,48 +271,18 @@ class Table(QAbstractTableModel):
         self.stack.push(RowCommand(oldVisualIndex, self, parent, False))
         # create a command to make a new row with the old data
         cmd = RowCommand(newVisualIndex, self, parent)
-        cmd.rowdata = olddata
+        cmd.rowdata = [olddata]
         self.stack.push(cmd)
         self.stack.endMacro()
 
     def _isCommented(self, row):
         return self.rows[row][0].value()
 
-    def _nameList(self, filt = None, without = None, upto = None):
-        # need to search all tables for a string list of object names
+    def _nameList(self, filt = None, upto = None):
+        # string list of object names from all tables in display order
         # filt is a ModuleBase subclass to filter by
-        # without is a row number to exclude from the current table
         # upto means only look at objects up to "upto" row in the current table
-        if (filt, without, upto) in self._cachedNameList:
-            timestamp, sl = self._cachedNameList[(filt, without, upto)]
-            if self._parent.lastModified() < timestamp:
-                return sl
-        sl = []
-        for name in self._parent.getTableNames():
-            table = self._parent._tables[name]
-            # if we have a filter, then make sure this table is a subclass of it
-            if filt is not None and type(filt) == type and \
-                    type(table.ob) == type and \
-                    not issubclass(table.ob, filt):
-                # if we are only going up to a certain table and this is it
-                if table == self and upto is not None:
-                    return sl
-                continue
-            for i,trow in enumerate(table.rows):
-                if table == self:
-                    # if the current table is self, make sure we are excluding
-                    # the without row
-                    if without is not None and without == i:
-                        continue
-                    # make sure we only go up to upto
-                    if upto is not None and upto == i:
-                        return sl
-                # add a non-null name, which is not commented out to the list
-                if not trow[2].isNull() and not trow[0].value():
-                    sl.append(str(trow[2].value()))
-        # store the cached value
-        self._cachedNameList[(filt, without, upto)] = (time.time(), sl)
-        return sl
+        return self._parent.names.names(filt, self, upto)
 
     def _isInvalid(self, qvar, row, col):
         # check that required rows are filled in
@@ -309,23 +294,21 @@ class Table(QAbstractTableModel):
         # check that names are unique
         elif col == 2:
             name = str(qvar.value())
-            if name in self._nameList(without = row):
+            if not self._parent.names.isUnique(self, row, name):
                 return 'Object with name "%s" already exists' % name
         # check that idents are valid
         elif col in self._idents:
             name = str(qvar.value())
             ob = self._types[col]
-            if name not in self._nameList(filt = ob, upto = row):
+            if not self._parent.names.isDefined(self, row, name, ob):
                 return 'Can\'t perform identifier lookup on "%s"' % name
         # check that enums are valid
         elif col in self._cValues:
-            if not max([qvar == x for x in self._cValues[col]]):
+            if _valueKey(qvar.value()) not in self._cValueSet[col]:
                 return '"%s" is not a supported enum' % str(qvar.value())
         # check that choices are valid
         elif col in self._cItems:
-            if not max(
-                [qvar == QVariant(x)
-                 for x in self._cItems[col].value()]):
+            if _valueKey(qvar.value()) not in self._cItemSet[col]:
                 return '"%s" is not a supported choice' % str(qvar.value())
         # check the type of basetypes
         else:
@@ -335,6 +318,23 @@ class Table(QAbstractTableModel):
                 return 'Cannot convert "%s" to %s' % (str(qvar.value()), typ)
         return False
 
+    def _cellInvalid(self, row, col):
+        # _isInvalid for the contents of a cell, cached.  Cells are replaced
+        # rather than modified, so the result stands while the same cell is
+        # in place and, for names and idents, the name hasn't been changed
+        # anywhere else
+        cell = self.rows[row][col]
+        if col == 2 or col in self._idents:
+            stamp = self._parent.names.stamp(str(cell.value()))
+        else:
+            stamp = None
+        cached = self._validity.get((row, col))
+        if cached is not None and cached[0] is cell and cached[1] == stamp:
+            return cached[2]
+        invalid = self._isInvalid(cell, row, col)
+        self._validity[(row, col)] = (cell, stamp, invalid)
+        return invalid
+
     def _isDefault(self, qvar, col):
         return qvar.isNull() and col in self._defaults
 
@@ -388,7 +388,7 @@ class Table(QAbstractTableModel):
             return qvar
         elif role == Qt.ToolTipRole:
             # tooltip
-            error = self._isInvalid(qvar, row, col)
+            error = self._cellInvalid(row, col)
             text = str(self._tooltips[col].value())
             if error:
                 text = '***Error: %s\n%s'%(error, text)
@@ -410,7 +410,7 @@ class Table(QAbstractTableModel):
             if self._isDefault(qvar, col):
                 # is default arg (always valid)
                 return QVariant(QColor(160,160,160))
-            elif self._isInvalid(qvar, row, col):
+            elif self._cellInvalid(row, col):
                 # invalid
                 return QVariant(QColor(255,0,0))
             else:
@@ -421,7 +421,7 @@ class Table(QAbstractTableModel):
             if self._isCommented(row):
                 # commented
                 return QVariant(QColor(160,180,220))
-            elif self._isInvalid(qvar, row, col):
+            elif self._cellInvalid(row, col):
                 # invalid
                 return QVariant(QColor(255,200,200))
             elif col in self._defaults:
@@ -447,15 +447,22 @@ class Table(QAbstractTableModel):
 
     def clearIndexes(self, indexes):
         # clear cells from a list of QModelIndex's
-        begun = False
-        for item in indexes:
-            if not self.rows[item.row()][item.column()].isNull():
-                if not begun:
-                    begun = True
-                    celltexts = [ '(%s, %d)' %
-                        (str(self._header[c.column()].value()), c.row() + 1) \
-                        for c in indexes ]
-                    self.stack.beginMacro('Cleared Cells: '+' '.join(celltexts))
-                self.setData(item, QVariant(''), Qt.EditRole)
-        if begun:
-            self.stack.endMacro()
+        cells = [ (item.row(), item.column(), QVariant(''))
+            for item in indexes
+            if not self.rows[item.row()][item.column()].isNull() ]
+        if cells:
+            celltexts = [ '(%s, %d)' %
+                (str(self._header[c.column()].value()), c.row() + 1) \
+                for c in indexes ]
+            self.setCells(cells, 'Cleared Cells: '+' '.join(celltexts))
+
+
+def _valueKey(value):
+    # normalised form of a cell or choice value, so that values which compare
+    # equal as QVariants, such as 1, 1.0 and "1", have the same key
+    if isinstance(value, bool):
+        return str(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
@@ -0,0 +1,81 @@
+#!/bin/env dls-python
+import multiprocessing
+import sys
+
+from optparse import OptionParser
+
+from xmlbuilder.xmlconfig import XmlConfig, read_architecture
+
+
+def validate_file(args):
+    '''Check the xml file against the catalogued module classes without
+    building anything, returns the filename and a list of errors'''
+    xml_file, simarch, debug, prescan = args
+    try:
+        if simarch is not None:
+            architecture = simarch
+        else:
+            architecture = read_architecture(xml_file)
+        xml_config = XmlConfig(debug=debug, arch=architecture,
+                               simarch=simarch, filename=xml_file,
+                               lazy=True, prescan=prescan)
+        errors = xml_config.iocbuilder.includeXml.validateXmlFile(xml_file)
+        # worker processes don't run exit handlers, so save the catalog now
+        xml_config.iocbuilder.cache.FlushAll()
+    except Exception as e:
+        errors = ['%s: %s' % (e.__class__.__name__, e)]
+    return xml_file, errors
+
+
+def main():
+    parser = OptionParser('usage: %prog [options] <xml-file> ...')
+    parser.add_option(
+        '-d', action='store_true', dest='debug',
+        help='Print lots of debug information')
+    parser.add_option(
+        '--sim', dest='simarch',
+        help='Validate as for an ioc with arch=SIMARCH in simulation mode')
+    parser.add_option(
+        '-j', dest='processes', type='int', default=None,
+        help='Number of files to validate in parallel (default: one per CPU)')
+
+    # parse arguments
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error(
+            '*** Error: Incorrect number of arguments - '
+            'you must supply at least one input file (.xml)')
+
+    if len(args) == 1:
+        results = [validate_file(
+            (args[0], options.simarch, options.debug, True))]
+    else:
+        # each file configures its own iocbuilder, so give each its own
+        # process.  Pool workers can't start a pool of their own to prescan
+        # the templates.
+        jobs = [(xml_file, options.simarch, options.debug, False)
+            for xml_file in args]
+        pool = multiprocessing.Pool(options.processes, maxtasksperchild=1)
+        try:
+            results = pool.map(validate_file, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    # report all the errors together
+    failed = 0
+    for xml_file, errors in results:
+        if errors:
+            failed += 1
+            for error in errors:
+                print('%s: %s' % (xml_file, error))
+        elif options.debug:
+            print('%s: OK' % xml_file)
+    if failed:
+        print('%d of %d files failed validation' % (failed, len(results)),
+            file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
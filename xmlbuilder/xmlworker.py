@@ -0,0 +1,28 @@
+import os
+import traceback
+
+from xmlbuilder.xmlconfig import XmlConfig
+
+
+def load(queue, filename, arch, simarch, debug):
+    '''Configure iocbuilder for filename and check the file in a worker
+    process, so that the catalog and template caches are up to date when the
+    gui makes its tables.  Progress is sent to queue as ('progress', text),
+    followed by ('done', errors) or ('error', traceback).  The worker is
+    daemonic, so can't start a pool to prescan the templates'''
+    def progress(text):
+        queue.put(('progress', text))
+    try:
+        xml_config = XmlConfig(debug=debug, arch=arch, simarch=simarch,
+                               filename=filename, lazy=True,
+                               progress=progress, prescan=False)
+        errors = []
+        if filename and os.path.isfile(filename):
+            progress('Validating %s' % os.path.basename(filename))
+            errors = xml_config.iocbuilder.includeXml.validateXmlFile(
+                filename)
+        # worker processes don't run exit handlers, so save the caches now
+        xml_config.iocbuilder.cache.FlushAll()
+        queue.put(('done', errors))
+    except Exception:
+        queue.put(('error', traceback.format_exc()))